@@ -2,11 +2,18 @@ from tests.conftest import badger
 from time import time
 from helpers.utils import sec, val
 from helpers.time_utils import days, to_days, to_hours, to_utc_date
+from array import array
 from dotmap import DotMap
 from rich.console import Console
 from tabulate import tabulate
 from config.badger_config import badger_config
-from statistics import mean
+from fractions import Fraction
+from math import gcd
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 console = Console()
 
@@ -21,15 +28,30 @@ class LinearLogic:
     """
     Linearly increasing rewards between two points. No further increase in rate after end point.
     Time on X axis, must start at 0
+
+    Integrals are exact: the multiplier is rational, so the integral over [x1, x2] is a rational with denominator 2 * duration * q,
+    q being the common denominator of the start and end multipliers
     """
 
     def __init__(self, start, end):
         self.start = Point(start["x"], start["y"])
         self.end = Point(end["x"], end["y"])
-        self.slope = (end["y"] - start["y"]) / (end["x"] - start["x"])
+        self.slope = Fraction(end["y"] - start["y"]) / (end["x"] - start["x"])
         self.intercept = start["y"]
         self.duration = end["x"] - start["x"]
 
+        # Integer representation: y = yNum / yDen
+        y0 = Fraction(start["y"])
+        y1 = Fraction(end["y"])
+        yDen = y0.denominator * y1.denominator // gcd(y0.denominator, y1.denominator)
+        self.y0Num = int(y0 * yDen)
+        self.y1Num = int(y1 * yDen)
+        self.yDen = yDen
+
+        # Integrals are computed as G(x2) - G(x1) over the common denominator 2 * duration * yDen
+        self.denominator = 2 * self.duration * yDen
+        self.endAntiderivative = self.antiderivative(self.duration)
+
     def y(self, x):
         start = self.start
         end = self.end
@@ -47,29 +69,130 @@ class LinearLogic:
             y = (slope * sinceStart) + intercept
         return y
 
+    def antiderivative(self, x):
+        """
+        Integral of y from 0 to x, scaled by self.denominator
+        """
+        assert x >= 0  # No negative values
+        if x > self.duration:
+            return self.endAntiderivative + 2 * self.duration * self.y1Num * (
+                x - self.duration
+            )
+        return 2 * self.duration * self.y0Num * x + (self.y1Num - self.y0Num) * x * x
+
     def integral(self, x1, x2):
-        y1 = self.y(x1)
-        y2 = self.y(x2)
+        """
+        Exact integral of y over [x1, x2]
+        """
+        return Fraction(
+            self.antiderivative(x2) - self.antiderivative(x1), self.denominator
+        )
 
-        xDiff = x2 - x1
-        yAverage = mean([y2, y1])
+    def integral_floor(self, x1, x2):
+        """
+        Integral of y over [x1, x2], rounded down, in integer arithmetic only
+        """
+        return (self.antiderivative(x2) - self.antiderivative(x1)) // self.denominator
 
-        # print("integral", x1, x2, xDiff, y1, y2, yAverage, xDiff * yAverage)
+    def flat_integral_numerator(self, x1, x2, amount):
+        """
+        Scaled integral over times [x1, x2], summed over stakes past the end of the ramp
+        """
+        return 2 * self.duration * self.y1Num * (x2 - x1) * amount
 
-        # console.log("multiplier at start time is {}".format(y1))
-        # console.log("multiplier at end time is {}".format(y2))
+    def antiderivative_array(self, x):
+        """
+        antiderivative over an int64 array, branch free: each x is split into its part on the ramp and its part past the end
+        """
+        ramp = numpy.minimum(x, self.duration)
+        return (
+            2 * self.duration * self.y0Num * ramp
+            + (self.y1Num - self.y0Num) * ramp * ramp
+            + 2 * self.duration * self.y1Num * (x - ramp)
+        )
+
+    def fits_int64(self, maxX):
+        """
+        Whether antiderivative stays within int64 for 0 <= x <= maxX
+        """
+        yNum = max(abs(self.y0Num), abs(self.y1Num))
+        return 4 * self.duration * yNum * (maxX + self.duration) < 2 ** 62
+
+    def integral_floor_many(self, x1s, x2s):
+        """
+        integral_floor over columns of range starts and ends
+        Evaluated as whole numpy arrays when numpy is installed and the values fit in int64, one range at a time otherwise
+        """
+        if numpy is not None and len(x1s):
+            try:
+                x1 = numpy.asarray(x1s, dtype=numpy.int64)
+                x2 = numpy.asarray(x2s, dtype=numpy.int64)
+            except OverflowError:
+                x1 = None
+            if x1 is not None and self.fits_int64(int(max(x1.max(), x2.max()))):
+                assert x1.min() >= 0  # No negative values
+                return (
+                    (self.antiderivative_array(x2) - self.antiderivative_array(x1))
+                    // self.denominator
+                ).tolist()
+
+        antiderivative = self.antiderivative
+        denominator = self.denominator
+        return [
+            (antiderivative(x2) - antiderivative(x1)) // denominator
+            for x1, x2 in zip(x1s, x2s)
+        ]
+
+
+class UnlockSchedule:
+    __slots__ = ["initialTokensLocked", "endTime", "duration", "startTime"]
+
+    def __init__(self, initialTokensLocked, endTime, duration, startTime):
+        self.initialTokensLocked = initialTokensLocked
+        self.endTime = endTime
+        self.duration = duration
+        self.startTime = startTime
+
+
+class GeyserUser:
+    """
+    Stake state for a single user
+    Stakes still on the multiplier ramp are kept as parallel arrays of amounts and stake times, oldest first
+    Stakes that have reached the end multiplier are all equivalent and are folded into a single bucket below them on the stack
+    total, shareSeconds and shareSecondsInRange are None until first set
+    """
 
-        return xDiff * yAverage
+    __slots__ = [
+        "id",
+        "address",
+        "stakeAmounts",
+        "stakedAts",
+        "maturedAmount",
+        "total",
+        "lastUpdate",
+        "shareSeconds",
+        "shareSecondsInRange",
+    ]
+
+    def __init__(self, id, address):
+        self.id = id
+        self.address = address
+        self.stakeAmounts = []
+        self.stakedAts = array("q")
+        self.maturedAmount = 0
+        self.total = None
+        self.lastUpdate = None
+        self.shareSeconds = None
+        self.shareSecondsInRange = None
 
 
 class BadgerGeyserMock:
     def __init__(self, key):
         self.key = key
-        self.events = DotMap()
-        self.stakes = DotMap()
         self.totalShareSeconds = 0
-        self.users = DotMap()
-        self.unlockSchedules = DotMap()
+        self.users = {}
+        self.userList = []
+        self.unlockSchedules = {}
         self.distributionTokens = []
         self.totalDistributions = DotMap()
         self.totalShareSecondsInRange = 0
@@ -93,11 +216,22 @@ class BadgerGeyserMock:
     def add_distribution_token(self, token):
         self.distributionTokens.append(token)
 
+    def get_user(self, user):
+        """
+        Get the state for a user, interning the address on first use
+        """
+        data = self.users.get(user)
+        if data is None:
+            data = GeyserUser(len(self.userList), user)
+            self.users[user] = data
+            self.userList.append(data)
+        return data
+
     def add_unlock_schedule(self, token, unlockSchedule):
-        if not self.unlockSchedules[str(token)]:
+        if not str(token) in self.unlockSchedules:
             self.unlockSchedules[str(token)] = []
 
-        parsedSchedule = DotMap(
+        parsedSchedule = UnlockSchedule(
             initialTokensLocked=unlockSchedule[0],
             endTime=unlockSchedule[1],
             duration=unlockSchedule[2],
@@ -106,9 +240,6 @@ class BadgerGeyserMock:
 
         self.unlockSchedules[str(token)].append(parsedSchedule)
 
-        # console.log(
-        #     "add_unlock_schedule for", str(token), parsedSchedule.toDict(),
-        # )
 
     def get_distributed_for_token_at(self, token, endTime, read=False):
         """
@@ -116,7 +247,7 @@ class BadgerGeyserMock:
         """
         totalToDistribute = 0
 
-        unlockSchedules = self.unlockSchedules[token]
+        unlockSchedules = self.unlockSchedules.get(str(token), [])
         index = 0
         for schedule in unlockSchedules:
 
@@ -229,13 +360,13 @@ class BadgerGeyserMock:
             userMetadata[user] = {}
             for token, tokenAmount in tokenDistributions.items():
                 # Record total share seconds
-                if not "shareSeconds" in userData:
+                if userData.shareSeconds is None:
                     userMetadata[user]["shareSeconds"] = 0
                 else:
                     userMetadata[user]["shareSeconds"] = userData.shareSeconds
 
                 # Track Distribution based on seconds in range
-                if "shareSecondsInRange" in userData:
+                if userData.shareSecondsInRange is not None:
                     userMetadata[user][
                         "shareSecondsInRange"
                     ] = userData.shareSecondsInRange
@@ -275,26 +406,33 @@ class BadgerGeyserMock:
         # Update share seconds on unstake
         self.process_share_seconds(user, unstake.timestamp)
 
+        data = self.get_user(user)
+        amounts = data.stakeAmounts
+
         # Process unstakes from individual stakes
         toUnstake = int(unstake.amount)
-        while toUnstake > 0:
-            stake = self.users[user].stakes[-1]
+        while toUnstake > 0 and amounts:
+            amount = amounts[-1]
 
             # This stake won't cover, remove
-            if toUnstake >= stake["amount"]:
-                self.users[user].stakes.pop()
-                toUnstake -= stake["amount"]
+            if toUnstake >= amount:
+                amounts.pop()
+                data.stakedAts.pop()
+                toUnstake -= amount
 
             # This stake will cover the unstaked amount, reduce
             else:
-                self.users[user].stakes[-1]["amount"] -= toUnstake
+                amounts[-1] -= toUnstake
                 toUnstake = 0
 
-        # Update globals
-        self.users[user].total = unstake.userTotal
-        self.users[user].lastUpdate = unstake.timestamp
+        # Oldest stakes come from the matured bucket
+        if toUnstake > 0:
+            assert toUnstake <= data.maturedAmount
+            data.maturedAmount -= toUnstake
 
-        # console.log("unstake", self.users[user].toDict(), unstake, self.users[user])
+        # Update globals
+        data.total = unstake.userTotal
+        data.lastUpdate = unstake.timestamp
 
     def stake(self, user, stake):
         # Update share seconds for previous stakes on stake
@@ -304,19 +442,18 @@ class BadgerGeyserMock:
         self.addStake(user, stake)
 
         # Update Globals
-        self.users[user].lastUpdate = stake.timestamp
-        self.users[user].total = stake.userTotal
+        data = self.get_user(user)
+        data.lastUpdate = stake.timestamp
+        data.total = stake.userTotal
 
     def addStake(self, user, stake):
-        if not self.users[user].stakes:
-            self.users[user].stakes = []
-        self.users[user].stakes.append(
-            {"amount": stake.amount, "stakedAt": stake.stakedAt}
-        )
+        data = self.get_user(user)
+        data.stakeAmounts.append(stake.amount)
+        data.stakedAts.append(stake.stakedAt)
 
     def calc_end_share_seconds_for(self, user):
         self.process_share_seconds(user, self.endTime)
-        self.users[user].lastUpdate = self.endTime
+        self.get_user(user).lastUpdate = self.endTime
 
     def calc_end_share_seconds(self):
         """
@@ -324,75 +461,61 @@ class BadgerGeyserMock:
         If the user took no actions during the claim period, calculate their shareSeconds from their pre-existing stakes
         """
 
-        for user in self.users:
+        for user in list(self.users):
             self.process_share_seconds(user, self.endTime)
 
-    def caclulate_multiplier(self, stake, timestamp):
-        start = 0
+    def calculate_weighted_seconds(self, stake, lastUpdate, timestamp):
+        """
+        Get "weightedShareSeconds" in range
+        """
+        previous = lastUpdate - stake["stakedAt"]
         end = timestamp - stake["stakedAt"]
+        return self.logic.integral_floor(previous, end)
 
-        mult0 = self.logic.y(start)
-        mult2 = self.logic.y(end)
+    def calculate_aggregate_share_seconds(self, data, lastUpdate, timestamp):
+        """
+        Sum of amount * weightedSeconds over all stakes of a user, each stake's weighted seconds rounded down
+        Matured stakes all have the same weighted seconds, so the bucket costs one integral however many stakes it holds
+        """
+        logic = self.logic
+        stakedAts = data.stakedAts
 
-        return mean([mult0, mult2])
+        total = data.maturedAmount * (
+            logic.flat_integral_numerator(lastUpdate, timestamp, 1) // logic.denominator
+        )
+        weightedSeconds = logic.integral_floor_many(
+            [lastUpdate - stakedAt for stakedAt in stakedAts],
+            [timestamp - stakedAt for stakedAt in stakedAts],
+        )
+        for amount, weighted in zip(data.stakeAmounts, weightedSeconds):
+            total += amount * weighted
+        return total
 
-    def calculate_weighted_seconds(self, stake, lastUpdate, timestamp):
+    def advance_matured_stakes(self, data, timestamp):
         """
-        Get "weightedShareSeconds" in range
+        Fold stakes that have reached the end of the ramp by timestamp into the matured bucket
         """
-        # table = []
+        amounts = data.stakeAmounts
+        stakedAts = data.stakedAts
+        duration = self.logic.duration
 
-        start = 0
-        previous = lastUpdate - stake["stakedAt"]
-        end = timestamp - stake["stakedAt"]
+        matured = 0
+        while matured < len(amounts) and stakedAts[matured] + duration <= timestamp:
+            data.maturedAmount += amounts[matured]
+            matured += 1
 
-        # print("startY", start, self.logic.y(start))
-        # print("lastUpdateY", previous, self.logic.y(previous))
-        # print("timestampY", end, self.logic.y(end))
-
-        integral = self.logic.integral(previous, end)
-        weighted = int(timestamp - lastUpdate)
-
-        mult0 = self.logic.y(start)
-        mult1 = self.logic.y(previous)
-        mult2 = self.logic.y(end)
-
-        # table.append(
-        #     [
-        #         stake["amount"],
-        #         stake["stakedAt"],
-        #         lastUpdate,
-        #         timestamp,
-        #         weighted,
-        #         integral,
-        #         mult0,
-        #         mult1,
-        #         mult2,
-        #     ]
-        # )
-        # print(
-        #     tabulate(
-        #         table,
-        #         headers=[
-        #             "amount",
-        #             "stakedAt",
-        #             "lastUpdate",
-        #             "timestamp",
-        #             "weighted",
-        #             "integral",
-        #             "mult0",
-        #             "mult1",
-        #             "mult2",
-        #         ],
-        #     )
-        # )
-        return int(integral)
+        if matured:
+            del amounts[:matured]
+            del stakedAts[:matured]
+
+    def rebuild_stake_aggregates(self, data, timestamp):
+        self.advance_matured_stakes(data, timestamp)
 
     def process_share_seconds(self, user, timestamp):
-        data = self.users[user]
+        data = self.get_user(user)
 
         # Return 0 if user has no tokens
-        if not "total" in data:
+        if data.total is None:
             return 0
 
         lastUpdate = self.getLastUpdate(user)
@@ -409,19 +532,17 @@ class BadgerGeyserMock:
         toAdd = 0
         toAddInRange = 0
 
-        for stake in data.stakes:
-            stakeMultiplier = self.caclulate_multiplier(stake, timestamp)
-            toAdd += stake["amount"] * self.calculate_weighted_seconds(
-                stake, lastUpdate, timestamp
+        toAdd = self.calculate_aggregate_share_seconds(data, lastUpdate, timestamp)
+        if timestamp > self.startTime:
+            toAddInRange = self.calculate_aggregate_share_seconds(
+                data, lastUpdateRangeGated, timestamp
             )
-            if timestamp > self.startTime:
-                toAddInRange += stake["amount"] * self.calculate_weighted_seconds(
-                    stake, lastUpdateRangeGated, timestamp
-                )
         assert toAdd >= 0
 
+        self.advance_matured_stakes(data, timestamp)
+
         # If user has share seconds, add
-        if "shareSeconds" in data:
+        if data.shareSeconds is not None:
             data.shareSeconds += toAdd
             self.totalShareSeconds += toAdd
 
@@ -430,13 +551,51 @@ class BadgerGeyserMock:
             data.shareSeconds = toAdd
             self.totalShareSeconds += toAdd
 
-        if "shareSecondsInRange" in data:
+        if data.shareSecondsInRange is not None:
             data.shareSecondsInRange += toAddInRange
         else:
             data.shareSecondsInRange = toAddInRange
         self.totalShareSecondsInRange += toAddInRange
 
-        self.users[user] = data
+    # ===== Checkpoints =====
+
+    def get_checkpoint_state(self):
+        """
+        Per-user stake state at the current point in the replay, in a JSON serializable form
+        In-range values are specific to the current period and are not included
+        """
+        users = {}
+        for user, data in self.users.items():
+            if data.total is None:
+                continue
+            users[user] = {
+                "maturedAmount": data.maturedAmount,
+                "stakes": [
+                    {"amount": amount, "stakedAt": stakedAt}
+                    for amount, stakedAt in zip(data.stakeAmounts, data.stakedAts)
+                ],
+                "shareSeconds": data.shareSeconds or 0,
+                "lastUpdate": data.lastUpdate,
+                "total": data.total,
+            }
+        return {"totalShareSeconds": self.totalShareSeconds, "users": users}
+
+    def load_checkpoint_state(self, state):
+        """
+        Restore per-user stake state from a previous cycle, new actions can then be applied on top of it
+        """
+        self.totalShareSeconds = state["totalShareSeconds"]
+        for user, userState in state["users"].items():
+            data = self.get_user(user)
+            data.stakeAmounts = [stake["amount"] for stake in userState["stakes"]]
+            data.stakedAts = array(
+                "q", [stake["stakedAt"] for stake in userState["stakes"]]
+            )
+            data.maturedAmount = userState.get("maturedAmount", 0)
+            data.shareSeconds = userState["shareSeconds"]
+            data.lastUpdate = userState["lastUpdate"]
+            data.total = userState["total"]
+            self.rebuild_stake_aggregates(data, data.lastUpdate)
 
     # ===== Getters =====
 
@@ -444,9 +603,10 @@ class BadgerGeyserMock:
         """
         Get the last time the specified user took an action
         """
-        if not self.users[user].lastUpdate:
+        lastUpdate = self.get_user(user).lastUpdate
+        if not lastUpdate:
             return badger_config.globalStartTime
-        return self.users[user].lastUpdate
+        return lastUpdate
 
     def printState(self):
         table = []
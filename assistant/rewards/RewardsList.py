@@ -1,5 +1,4 @@
 from brownie import *
-from dotmap import DotMap
 from rich.console import Console
 from eth_utils.hexadecimal import encode_hex
 from eth_abi import decode_single, encode_single, encode_abi
@@ -10,25 +9,93 @@ console = Console()
 
 
 class RewardsList:
+    """
+    Rewards per user, with users and tokens interned in the order they were first added
+    Each user has a row of integer amounts indexed by token, None where the user has no entry for a token
+    Rows may be shared with the RewardsList they were merged from, either side copies a shared row before updating it
+    """
+
     def __init__(self, cycle, badgerTree) -> None:
-        self.claims = DotMap()
-        self.tokens = DotMap()
-        self.totals = DotMap()
         self.cycle = cycle
         self.badgerTree = badgerTree
-        self.metadata = DotMap()
-        self.sources = DotMap()
-        self.sourceMetadata = DotMap()
 
-    def increase_user_rewards_source(self, source, user, token, toAdd):
-        if not self.sources[source][user][token]:
-            self.sources[source][user][token] = 0
-        self.sources[source][user][token] += toAdd
+        self.tokens = []
+        self.tokenIndexes = {}
+        self.tokenTotals = []
+
+        self.users = []
+        self.userIndexes = {}
+        self.amounts = []
+
+        # Indexes of rows shared with another RewardsList
+        self.sharedRows = set()
+
+        # user -> token -> amount, built on first use and dropped on any update
+        self.claimsCache = None
+
+        self.metadata = {}
+
+    @classmethod
+    def from_rewards_tree(cls, tree, cycle=None, badgerTree=None):
+        """
+        Load the cumulative claims of a published rewards tree, in claim order
+        """
+        rewards = cls(cycle if cycle is not None else tree["cycle"], badgerTree)
+        for token in tree["tokenTotals"].keys():
+            rewards.token_index(token)
+
+        for user, claim in tree["claims"].items():
+            row = [None] * len(rewards.tokens)
+            for token, amount in zip(claim["tokens"], claim["cumulativeAmounts"]):
+                t = rewards.token_index(token)
+                if t >= len(row):
+                    row.extend([None] * (t + 1 - len(row)))
+                row[t] = int(amount)
+                rewards.tokenTotals[t] += int(amount)
+            rewards.userIndexes[user] = len(rewards.users)
+            rewards.users.append(user)
+            rewards.amounts.append(row)
+        return rewards
+
+    def token_index(self, token):
+        t = self.tokenIndexes.get(token)
+        if t is None:
+            t = len(self.tokens)
+            self.tokenIndexes[token] = t
+            self.tokens.append(token)
+            self.tokenTotals.append(0)
+        return t
+
+    def user_row(self, user):
+        u = self.userIndexes.get(user)
+        if u is None:
+            u = len(self.users)
+            self.userIndexes[user] = u
+            self.users.append(user)
+            self.amounts.append([])
+        return u
+
+    @property
+    def claims(self):
+        """
+        user -> token -> amount
+        """
+        if self.claimsCache is None:
+            self.claimsCache = {user: self.user_claims(user) for user in self.users}
+        return self.claimsCache
+
+    @property
+    def totals(self):
+        """
+        token -> amount
+        """
+        return dict(zip(self.tokens, self.tokenTotals))
 
-    def track_user_metadata_source(self, source, user, metadata):
-        if not self.sourceMetadata[source][user][metadata]:
-            self.sourceMetadata[source][user][metadata] = DotMap()
-        self.sourceMetadata[source][user][metadata] = metadata
+    def user_claims(self, user):
+        row = self.amounts[self.userIndexes[user]]
+        return {
+            self.tokens[t]: amount for t, amount in enumerate(row) if amount is not None
+        }
 
     def increase_user_rewards(self, user, token, toAdd):
         if toAdd < 0:
@@ -38,28 +105,76 @@ class RewardsList:
         """
         If user has rewards, increase. If not, set their rewards to this initial value
         """
-        if user in self.claims and token in self.claims[user]:
-            self.claims[user][token] += toAdd
-        else:
-            self.claims[user][token] = toAdd
+        u = self.user_row(user)
+        t = self.token_index(token)
+        row = self.amounts[u]
+        if u in self.sharedRows:
+            row = list(row)
+            self.amounts[u] = row
+            self.sharedRows.discard(u)
+        if t >= len(row):
+            row.extend([None] * (t + 1 - len(row)))
 
-        if token in self.totals:
-            self.totals[token] += toAdd
+        if row[t] is None:
+            row[t] = toAdd
         else:
-            self.totals[token] = toAdd
+            row[t] += toAdd
+        self.tokenTotals[t] += toAdd
+        self.claimsCache = None
 
     def track_user_metadata(self, user, metadata):
         if user in self.metadata:
-            self.metadata[user].shareSeconds += metadata[user]["shareSeconds"]
-            self.metadata[user].shareSecondsInRange += metadata[user][
+            self.metadata[user]["shareSeconds"] += metadata[user]["shareSeconds"]
+            self.metadata[user]["shareSecondsInRange"] += metadata[user][
                 "shareSecondsInRange"
             ]
         else:
-            self.metadata[user] = DotMap()
-            self.metadata[user].shareSeconds = metadata[user]["shareSeconds"]
-            self.metadata[user].shareSecondsInRange = metadata[user][
-                "shareSecondsInRange"
-            ]
+            self.metadata[user] = {
+                "shareSeconds": metadata[user]["shareSeconds"],
+                "shareSecondsInRange": metadata[user]["shareSecondsInRange"],
+            }
+
+    def merge_cumulative(self, new):
+        """
+        Add new rewards to these cumulative rewards, returning the result
+        Users with new rewards come first, in their order in new, followed by the remaining users in their existing order
+        Only users with new rewards get new rows, every other user shares its existing row with the result
+        """
+        result = RewardsList(new.cycle, new.badgerTree)
+
+        # Existing token indexes are kept, so existing rows stay valid
+        for token in self.tokens:
+            result.token_index(token)
+        tokenMap = [result.token_index(token) for token in new.tokens]
+        result.tokenTotals = list(self.tokenTotals) + result.tokenTotals[
+            len(self.tokens) :
+        ]
+
+        for user, newRow in zip(new.users, new.amounts):
+            u = self.userIndexes.get(user)
+            row = list(self.amounts[u]) if u is not None else []
+            for t, amount in enumerate(newRow):
+                if amount is None:
+                    continue
+                amount = max(amount, 0)
+                t = tokenMap[t]
+                if t >= len(row):
+                    row.extend([None] * (t + 1 - len(row)))
+                row[t] = amount if row[t] is None else row[t] + amount
+                result.tokenTotals[t] += amount
+            result.userIndexes[user] = len(result.users)
+            result.users.append(user)
+            result.amounts.append(row)
+
+        for u, (user, row) in enumerate(zip(self.users, self.amounts)):
+            if not user in result.userIndexes:
+                self.sharedRows.add(u)
+                result.sharedRows.add(len(result.users))
+                result.userIndexes[user] = len(result.users)
+                result.users.append(user)
+                result.amounts.append(row)
+
+        return result
 
     def printState(self):
         # console.log("claims", self.claims.toDict())
@@ -67,16 +182,17 @@ class RewardsList:
         # console.log("cycle", self.cycle)
         table = []
         # console.log("User State", self.users.toDict(), self.totalShareSeconds)
-        for user, data in self.claims.items():
+        for user in self.users:
+            data = self.user_claims(user)
             shareSeconds = 0
             shareSecondsInRange = 0
             if user in self.metadata:
-                shareSeconds = self.metadata[user].shareSeconds
-                shareSecondsInRange = self.metadata[user].shareSecondsInRange
+                shareSeconds = self.metadata[user]["shareSeconds"]
+                shareSecondsInRange = self.metadata[user]["shareSecondsInRange"]
             table.append(
                 [
                     user,
-                    data["0x3472A5A71965499acd81997a54BBA8D852C6E53d"],
+                    data.get("0x3472A5A71965499acd81997a54BBA8D852C6E53d", 0),
                     shareSeconds,
                     shareSecondsInRange,
                 ]
@@ -89,16 +205,16 @@ class RewardsList:
         )
 
     def hasToken(self, token):
-        if self.tokens[token]:
-            return self.tokens[token]
-        else:
-            return False
+        return token in self.tokenIndexes
 
     def getTokenRewards(self, user, token):
-        if self.claims[user][token]:
-            return self.claims[user][token]
-        else:
+        if not user in self.userIndexes or not token in self.tokenIndexes:
             return 0
+        row = self.amounts[self.userIndexes[user]]
+        t = self.tokenIndexes[token]
+        if t < len(row) and row[t]:
+            return row[t]
+        return 0
 
     def to_node_entry(self, user, userData, cycle, index):
         nodeEntry = {
@@ -183,7 +299,6 @@ class RewardsList:
         - Node entry = [cycle, user, index, token[], cumulativeAmount[]]
         """
         cycle = self.cycle
-        dict = self.claims.toDict()
 
         nodeEntries = []
         encodedEntries = []
@@ -191,7 +306,8 @@ class RewardsList:
 
         index = 0
 
-        for user, userData in self.claims.items():
+        for user in self.users:
+            userData = self.user_claims(user)
             (nodeEntry, encoded) = self.to_node_entry(user, userData, cycle, index)
             nodeEntries.append(nodeEntry)
             encodedEntries.append(encoded)
@@ -1,36 +1,136 @@
+import gzip
+import os
+import shutil
+import threading
+import zlib
+
 import boto3
+from assistant.rewards.rewards_cache import RewardsFileCache
+from boto3.s3.transfer import TransferConfig
 from brownie import *
+from config.rewards_config import rewards_config
 from rich.console import Console
 
 console = Console()
 
+upload_bucket = "badger-json"
 
-def download(fileName):
-    s3 = boto3.client("s3")
+# Error codes for a key that doesn't exist, credential and permission errors are not cached as missing
+missingKeyErrors = ["NoSuchKey", "404"]
+
+# Clients are thread safe and expensive to create, one per credential set is shared
+clients = {}
+clientsLock = threading.Lock()
+
+
+def get_s3_client(authenticated=False):
+    """
+    Shared S3 client, authenticated with the configured keys for uploads
+    """
+    with clientsLock:
+        if authenticated not in clients:
+            if authenticated:
+                from config.env_config import env_config
+
+                clients[authenticated] = boto3.client(
+                    "s3",
+                    aws_access_key_id=env_config.aws_access_key_id,
+                    aws_secret_access_key=env_config.aws_secret_access_key,
+                )
+            else:
+                clients[authenticated] = boto3.client("s3")
+        return clients[authenticated]
+
+
+def transfer_config():
+    return TransferConfig(
+        multipart_threshold=rewards_config.s3MultipartThreshold,
+        multipart_chunksize=rewards_config.s3MultipartChunkSize,
+        max_concurrency=rewards_config.s3MaxConcurrency,
+    )
+
+
+def iter_decoded_body(body, contentEncoding=None, chunkSize=1 << 20):
+    """
+    Read an object body in chunks, decompressing as it streams if gzip encoded
+    """
+    decompressor = None
+    if contentEncoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    for chunk in iter(lambda: body.read(chunkSize), b""):
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def gzip_file(fileName):
+    """
+    Compress fileName to fileName.gz, streaming, returns the compressed path
+    """
+    gzipFileName = fileName + ".gz"
+    with open(fileName, "rb") as f, gzip.open(gzipFileName, "wb") as outfile:
+        shutil.copyfileobj(f, outfile, 1 << 20)
+    return gzipFileName
+
+
+def open_download(fileName):
+    """
+    Open a rewards file as a binary file object, e.g. for json.load
+    Rewards files are named by their content hash, so are served from the local cache once downloaded
+    The download is decompressed and written to the cache as it streams, it is never held in memory whole
+    """
+    return RewardsFileCache().open(fileName, download_from_s3)
+
+
+def download_from_s3(fileName):
+    """
+    The object's content in chunks, decompressed as they arrive
+    """
+    s3 = get_s3_client()
 
-    upload_bucket = "badger-json"
     upload_file_key = "rewards/" + fileName
 
     console.print("Downloading file from s3: " + upload_file_key)
 
     s3_clientobj = s3.get_object(Bucket=upload_bucket, Key=upload_file_key)
-    # console.print(s3_clientobj)
-    s3_clientdata = s3_clientobj["Body"].read().decode("utf-8")
+    # Older files were uploaded uncompressed
+    return iter_decoded_body(s3_clientobj["Body"], s3_clientobj.get("ContentEncoding"))
 
-    return s3_clientdata
 
+def download_bytes(fileName):
+    with open_download(fileName) as f:
+        return f.read()
 
-def upload(fileName):
-    from config.env_config import env_config
 
-    upload_bucket = "badger-json"
+def download(fileName):
+    return download_bytes(fileName).decode("utf-8")
+
+
+def upload(fileName):
     upload_file_key = "rewards/" + fileName
 
     console.print("Uploading file to s3: " + upload_file_key)
 
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=env_config.aws_access_key_id,
-        aws_secret_access_key=env_config.aws_secret_access_key,
+    contentType = (
+        "application/json" if fileName.endswith(".json") else "application/octet-stream"
     )
-    s3.upload_file(fileName, upload_bucket, upload_file_key)
+
+    # Served with Content-Encoding: gzip, so HTTP clients decompress transparently
+    gzipFileName = gzip_file(fileName)
+    try:
+        get_s3_client(authenticated=True).upload_file(
+            gzipFileName,
+            upload_bucket,
+            upload_file_key,
+            ExtraArgs={"ContentEncoding": "gzip", "ContentType": contentType},
+            Config=transfer_config(),
+        )
+    finally:
+        os.remove(gzipFileName)
@@ -0,0 +1,124 @@
+import json
+import os
+
+from brownie import *
+from config.rewards_config import rewards_config
+from rich.console import Console
+from web3._utils.request import make_post_request
+
+console = Console()
+
+
+class BlockCache:
+    """
+    Process-wide cache of block timestamps
+    Blocks older than the confirmation depth are finalized for our purposes and are also persisted to disk
+    """
+
+    def __init__(self, path=None, confirmations=None):
+        if path is None:
+            path = rewards_config.blockCacheFile
+        if confirmations is None:
+            confirmations = rewards_config.eventStoreConfirmations
+        self.path = path
+        self.confirmations = confirmations
+        self.timestamps = {}
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            for number, timestamp in data.get(str(chain.id), {}).items():
+                self.timestamps[int(number)] = timestamp
+
+    def save(self):
+        if not self.path:
+            return
+        finalized = chain.height - self.confirmations
+
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+        data[str(chain.id)] = {
+            str(number): timestamp
+            for number, timestamp in self.timestamps.items()
+            if number <= finalized
+        }
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as outfile:
+            json.dump(data, outfile)
+
+    def get_timestamp(self, blockNumber):
+        return self.get_timestamps([blockNumber])[blockNumber]
+
+    def get_timestamps(self, blockNumbers):
+        """
+        Resolve many block numbers to timestamps, all uncached blocks are requested in a single JSON-RPC batch
+        blockNumber -> timestamp
+        """
+        if not self.loaded:
+            self.load()
+
+        missing = sorted(set(int(n) for n in blockNumbers) - set(self.timestamps))
+        if missing:
+            self.timestamps.update(fetch_block_timestamps(missing))
+            self.save()
+
+        return {n: self.timestamps[int(n)] for n in blockNumbers}
+
+
+def fetch_block_timestamps(blockNumbers):
+    """
+    Fetch timestamps with one batched eth_getBlockByNumber call, falling back to individual calls for non-HTTP providers
+    The batch is posted on the provider's session with its request kwargs (headers, auth, timeout)
+    """
+    endpoint = getattr(web3.provider, "endpoint_uri", None)
+    if (
+        not endpoint
+        or not str(endpoint).startswith("http")
+        or not hasattr(web3.provider, "get_request_kwargs")
+    ):
+        return {n: web3.eth.getBlock(n)["timestamp"] for n in blockNumbers}
+
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "eth_getBlockByNumber",
+            "params": [hex(n), False],
+        }
+        for i, n in enumerate(blockNumbers)
+    ]
+    response = make_post_request(
+        endpoint,
+        json.dumps(payload).encode(),
+        **web3.provider.get_request_kwargs()
+    )
+
+    timestamps = {}
+    for result in json.loads(response):
+        if "error" in result or not result.get("result"):
+            raise ValueError(
+                "Failed to fetch block {}: {}".format(
+                    blockNumbers[result["id"]], result.get("error")
+                )
+            )
+        timestamps[blockNumbers[result["id"]]] = int(
+            result["result"]["timestamp"], 16
+        )
+    return timestamps
+
+
+block_cache = BlockCache()
+
+
+def get_block_timestamp(blockNumber):
+    return block_cache.get_timestamp(blockNumber)
+
+
+def get_block_timestamps(blockNumbers):
+    return block_cache.get_timestamps(blockNumbers)
@@ -2,38 +2,174 @@ from collections import OrderedDict
 
 from config.rewards_config import rewards_config
 from assistant.rewards.BadgerGeyserMock import BadgerGeyserMock
-from assistant.subgraph.client import fetch_all_geyser_events
+from assistant.rewards.block_cache import get_block_timestamps
+from assistant.rewards.event_sources import SubgraphEventSource, get_event_source
+from assistant.rewards.event_store import GeyserEventStore
+from assistant.rewards.geyser_checkpoints import GeyserCheckpointStore
 from brownie import *
 from dotmap import DotMap
 from helpers.constants import AddressZero
+from requests import Session
 from rich.console import Console
-from tqdm import trange
+from web3 import HTTPProvider
 
 console = Console()
 
 globalStartBlock = 11381000
 
-def calc_geyser_stakes(key, geyser, periodStartBlock, periodEndBlock):
-    globalStartTime = web3.eth.getBlock(globalStartBlock)["timestamp"]
-    periodStartTime = web3.eth.getBlock(periodStartBlock)["timestamp"]
-    periodEndTime = web3.eth.getBlock(periodEndBlock)["timestamp"]
+def calc_geyser_stakes(
+    key, geyser, periodStartBlock, periodEndBlock, events=None, checkpoints=None
+):
+    # Blocks after confirmedBlock may still be reorged, the checkpoint is taken before them so every cycle replays them again
+    confirmedBlock = periodEndBlock - rewards_config.eventStoreConfirmations
+    timestamps = get_block_timestamps([periodStartBlock, confirmedBlock, periodEndBlock])
+    periodStartTime = timestamps[periodStartBlock]
+    periodEndTime = timestamps[periodEndBlock]
+
+    if checkpoints is None:
+        checkpoints = GeyserCheckpointStore()
+
+    # Resume from the state at the end of a previous cycle if we have one
+    replayStartBlock = globalStartBlock
+    checkpoint = checkpoints.latest(geyser.address, periodStartBlock - 1)
+    if checkpoint:
+        console.print(
+            "\n[grey]Resume from checkpoint at block {}[/grey]".format(
+                checkpoint["block"]
+            )
+        )
+        replayStartBlock = checkpoint["block"] + 1
+
+    # Collect events since the last checkpoint
+    console.print(
+        "\n[grey]Collect Actions: {} -> {}[/grey]".format(replayStartBlock, periodEndBlock)
+    )
+    if events is None:
+        events = collect_geyser_events(
+            {"geyser": geyser}, replayStartBlock, periodEndBlock
+        )["geyser"]
+    events = [e for e in events if e["blockNumber"] >= replayStartBlock]
 
     geyserMock = BadgerGeyserMock(key)
     geyserMock.set_current_period(periodStartTime, periodEndTime)
+    geyserMock = replay_events(
+        geyserMock, checkpoint, events, replayStartBlock, periodEndBlock
+    )
 
-    # Collect actions from the total history
-    console.print("\n[grey]Collect Actions: Entire History[/grey]")
-    actions = collect_actions_from_events(geyser, globalStartBlock, periodEndBlock)
-
-    # Process actions from the total history
-    console.print("\n[grey]Process Actions: Entire History[/grey]")
-    geyserMock = process_actions(geyserMock, actions, globalStartBlock, periodEndBlock)
+    if confirmedBlock >= replayStartBlock:
+        confirmedTime = timestamps[confirmedBlock]
+        confirmedMock = BadgerGeyserMock(key)
+        confirmedMock.set_current_period(confirmedTime, confirmedTime)
+        confirmedMock = replay_events(
+            confirmedMock,
+            checkpoint,
+            [e for e in events if e["blockNumber"] <= confirmedBlock],
+            replayStartBlock,
+            confirmedBlock,
+        )
+        checkpoints.save(
+            geyser.address,
+            confirmedBlock,
+            confirmedTime,
+            confirmedMock.get_checkpoint_state(),
+        )
 
     return calculate_token_distributions(
         geyser, geyserMock, periodStartTime, periodEndTime
     )
 
 
+def replay_events(geyserMock, checkpoint, events, replayStartBlock, endBlock):
+    """
+    Apply events from replayStartBlock to endBlock on top of a checkpoint, if any
+    Every user accrues share seconds up to the end of the mock's period
+    """
+    if checkpoint:
+        geyserMock.load_checkpoint_state(checkpoint)
+
+    console.print(
+        "\n[grey]Process Actions: {} -> {}[/grey]".format(replayStartBlock, endBlock)
+    )
+    actions = events_to_actions(events)
+    geyserMock = process_actions(geyserMock, actions, replayStartBlock, endBlock)
+
+    # Users restored from the checkpoint without new actions still accrue share seconds up to the end of the period
+    for user in list(geyserMock.users.keys()):
+        if not user in actions:
+            geyserMock.calc_end_share_seconds_for(user)
+    return geyserMock
+
+
+class GeyserSnapshot:
+    """
+    Distribution tokens and unlock schedules of a geyser, read once in the parent so that geyser workers make no RPC calls
+    """
+
+    def __init__(self, address, unlockSchedules):
+        self.address = address
+        self.unlockSchedules = unlockSchedules
+
+    @staticmethod
+    def read(geyser):
+        return GeyserSnapshot(
+            str(geyser.address),
+            {
+                str(token): [
+                    tuple(schedule) for schedule in geyser.getUnlockSchedulesFor(token)
+                ]
+                for token in geyser.getDistributionTokens()
+            },
+        )
+
+    def getDistributionTokens(self):
+        return list(self.unlockSchedules)
+
+    def getUnlockSchedulesFor(self, token):
+        return self.unlockSchedules[str(token)]
+
+
+class DeferredCheckpoints:
+    """
+    Checkpoint store for geyser workers: checkpoints are read from the store, saves are handed back to the parent to write
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.saved = []
+
+    def latest(self, geyserAddress, maxBlock):
+        return self.store.latest(geyserAddress, maxBlock)
+
+    def save(self, geyserAddress, block, endTime, state):
+        self.saved.append((geyserAddress, block, endTime, state))
+
+
+def init_geyser_worker():
+    """
+    Process pool initializer
+    A forked worker must not share the parent's HTTP session, so it gets a provider with a session of its own
+    """
+    provider = web3.provider
+    endpoint = getattr(provider, "endpoint_uri", None)
+    if endpoint and str(endpoint).startswith("http"):
+        web3.provider = HTTPProvider(
+            endpoint, request_kwargs=provider.get_request_kwargs(), session=Session()
+        )
+
+
+def calc_geyser_stakes_task(task):
+    """
+    Process pool entry point for calc_geyser_stakes
+    Inputs and outputs are plain data: (key, GeyserSnapshot, periodStartBlock, periodEndBlock, events) -> (userDistributions, checkpoint saves)
+    """
+    (key, geyser, periodStartBlock, periodEndBlock, events) = task
+    checkpoints = DeferredCheckpoints(GeyserCheckpointStore())
+    userDistributions = calc_geyser_stakes(
+        key, geyser, periodStartBlock, periodEndBlock, events, checkpoints
+    )
+    return (userDistributions, checkpoints.saved)
+
+
 def calculate_token_distributions(
     geyser, geyserMock: BadgerGeyserMock, snapshotStartTime, periodEndTime
 ):
@@ -61,112 +197,85 @@ def calculate_token_distributions(
     return userDistributions
 
 
-def collect_actions(geyser):
-    actions = DotMap()
-    # == Process Unstaked ==
-    data = fetch_all_geyser_events(geyser)
-    staked = data["stakes"]
-    unstaked = data["unstakes"]
-
-    console.print(
-        "Processing {} Staked events for Geyser {} ...".format(len(staked), geyser)
-    )
-    for event in staked:
-        timestamp = event["timestamp"]
-        user = event["user"]
-        if user != AddressZero:
-            if not actions[user][timestamp]:
-                actions[user][timestamp] = []
-            actions[user][timestamp].append(
-                DotMap(
-                    user=user,
-                    action="Stake",
-                    amount=int(event["amount"]),
-                    userTotal=int(event["total"]),
-                    stakedAt=int(event["timestamp"]),
-                    timestamp=int(event["timestamp"]),
-                )
-            )
-    # == Process Unstaked ==
-    console.print(
-        "Processing {} Unstaked events for Geyser {} ...".format(len(unstaked), geyser)
+def collect_actions(geyser, startBlock=globalStartBlock, endBlock=None):
+    """
+    Construct actions from the subgraph, rather than from node logs
+    """
+    if endBlock is None:
+        endBlock = chain.height
+    return collect_actions_from_events(
+        geyser, startBlock, endBlock, eventSource=SubgraphEventSource()
     )
-    for event in unstaked:
-        timestamp = event["timestamp"]
-        user = event["user"]
-        if user != AddressZero:
-            if not actions[user][timestamp]:
-                actions[user][timestamp] = []
-            actions[user][timestamp].append(
-                DotMap(
-                    user=user,
-                    action="Unstake",
-                    amount=int(event["amount"]),
-                    userTotal=int(event["total"]),
-                    stakedAt=int(event["timestamp"]),
-                    timestamp=int(event["timestamp"]),
+
+
+def collect_geyser_events(
+    geysers, startBlock, endBlock, eventStore=None, eventSource=None
+):
+    """
+    Collect events for all geysers (key -> geyser) from the event store, fetching missing blocks for all of them in one pass
+    Events come from the configured event source unless one is given
+    A source that has not indexed up to endBlock is an error, rewards are never computed from missing events
+    key -> event[]
+    """
+    if eventSource is None:
+        eventSource = get_event_source()
+
+    addresses = {key: str(geyser.address) for key, geyser in geysers.items()}
+    if eventSource.persistent:
+        if eventStore is None:
+            eventStore = GeyserEventStore(source=eventSource.name)
+
+        # Read before fetching, every event up to this block is then in the fetched results
+        indexedBlock = eventSource.indexed_block()
+        if indexedBlock is not None and indexedBlock < endBlock:
+            raise ValueError(
+                "{} source has only indexed up to block {}, of {}".format(
+                    eventSource.name, indexedBlock, endBlock
                 )
             )
-    return actions
+        events = eventStore.get_events_for_all(
+            list(addresses.values()),
+            startBlock,
+            endBlock,
+            eventSource.fetch,
+            indexedBlock,
+        )
+    else:
+        events = eventSource.fetch(list(addresses.values()), startBlock, endBlock)
+    return {key: events[address] for key, address in addresses.items()}
 
 
-def collect_actions_from_events(geyser, startBlock, endBlock):
+def events_to_actions(events):
     """
-    Construct a sequence of stake and unstake actions from events
-    Unstakes for a given block are ALWAYS processed after the stakes, as we aren't tracking the transaction order within a block
-    This could have extremely minor impact on rewards if stakes & unstakes happen during the same block (it would break if tracked the other way around, without knowing order)
-    user -> timestamp -> action[]
-    action: STAKE or UNSTAKE w/ parameters. (Stakes are always processed before unstakes within a given block)
+    Group events into user -> timestamp -> action[]
+    All Staked events are added before any Unstaked events, so stakes within a timestamp are always processed first
     """
-    contract = web3.eth.contract(geyser.address, abi=BadgerGeyser.abi)
     actions = DotMap()
 
-    # Add stake actions
-    for start in trange(startBlock, endBlock, 1000):
-        end = min(start + 999, endBlock)
-        logs = contract.events.Staked().getLogs(fromBlock=start, toBlock=end)
-        for log in logs:
-            timestamp = log["args"]["timestamp"]
-            user = log["args"]["user"]
-            # console.log("Staked", log["args"])
+    for eventName, actionName in [("Staked", "Stake"), ("Unstaked", "Unstake")]:
+        ordered = sorted(
+            [e for e in events if e["event"] == eventName],
+            key=lambda e: (e["blockNumber"], e["logIndex"]),
+        )
+        for event in ordered:
+            timestamp = event["timestamp"]
+            user = event["user"]
             if user != AddressZero:
                 if not actions[user]:
                     actions[user] = OrderedDict()
                 if not timestamp in actions[user]:
                     actions[user][timestamp] = []
-                actions[user][timestamp].append(
-                    DotMap(
-                        user=user,
-                        action="Stake",
-                        amount=log["args"]["amount"],
-                        userTotal=log["args"]["total"],
-                        stakedAt=log["args"]["timestamp"],
-                        timestamp=log["args"]["timestamp"],
-                    )
+                action = DotMap(
+                    user=user,
+                    action=actionName,
+                    amount=event["amount"],
+                    userTotal=event["total"],
+                    timestamp=event["timestamp"],
                 )
+                if actionName == "Stake":
+                    action.stakedAt = event["timestamp"]
+                actions[user][timestamp].append(action)
 
-    # Add unstake actions
-    for start in trange(startBlock, endBlock, 1000):
-        end = min(start + 999, endBlock)
-        logs = contract.events.Unstaked().getLogs(fromBlock=start, toBlock=end)
-        for log in logs:
-            timestamp = log["args"]["timestamp"]
-            user = log["args"]["user"]
-            # console.log("Unstaked", log["args"])
-            if user != AddressZero:
-                if not actions[user]:
-                    actions[user] = OrderedDict()
-                if not timestamp in actions[user]:
-                    actions[user][timestamp] = []
-                actions[user][timestamp].append(
-                    DotMap(
-                        user=user,
-                        action="Unstake",
-                        amount=log["args"]["amount"],
-                        userTotal=log["args"]["total"],
-                        timestamp=log["args"]["timestamp"],
-                    )
-                )
     # Sort timestamps within each user
     for user, timestamps in actions.items():
         sortedDict = OrderedDict(sorted(timestamps.items()))
@@ -174,6 +283,24 @@ def collect_actions_from_events(geyser, startBlock, endBlock):
     return actions
 
 
+def collect_actions_from_events(
+    geyser, startBlock, endBlock, eventStore=None, eventSource=None
+):
+    """
+    Construct a sequence of stake and unstake actions from events
+    Unstakes for a given block are ALWAYS processed after the stakes, as we aren't tracking the transaction order within a block
+    This could have extremely minor impact on rewards if stakes & unstakes happen during the same block (it would break if tracked the other way around, without knowing order)
+    user -> timestamp -> action[]
+    action: STAKE or UNSTAKE w/ parameters. (Stakes are always processed before unstakes within a given block)
+
+    Events are read through the local event store, only blocks past the last persisted height are fetched from the node
+    """
+    events = collect_geyser_events(
+        {"geyser": geyser}, startBlock, endBlock, eventStore, eventSource
+    )
+    return events_to_actions(events["geyser"])
+
+
 def process_actions(
     geyserMock: BadgerGeyserMock, actions, snapshotStartBlock, periodEndBlock
 ):
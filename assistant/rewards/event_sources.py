@@ -0,0 +1,181 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+from assistant.rewards.log_fetcher import get_logs_parallel
+from assistant.subgraph.client import fetch_all_geyser_events, fetch_indexed_block
+from brownie import *
+from config.rewards_config import rewards_config
+from rich.console import Console
+
+console = Console()
+
+"""
+Sources of geyser Staked / Unstaked events
+
+Every source returns geyser -> event[] for a block range (inclusive), with events normalized to:
+    {event, user, amount, total, timestamp, blockNumber, logIndex}
+event is "Staked" or "Unstaked", user is a checksum address, and all numbers are ints
+"""
+
+
+class GeyserEventSource(ABC):
+    name = None
+
+    # Whether fetched events should be persisted in the local event store
+    persistent = True
+
+    @abstractmethod
+    def fetch(self, geyserAddresses, startBlock, endBlock):
+        pass
+
+    def indexed_block(self):
+        """
+        The latest block this source serves complete events for, or None if it serves any block asked for
+        """
+        return None
+
+
+class RpcEventSource(GeyserEventSource):
+    """
+    Node getLogs, one pass over all geysers
+    """
+
+    name = "rpc"
+
+    def fetch(self, geyserAddresses, startBlock, endBlock):
+        return fetch_geyser_events(geyserAddresses, startBlock, endBlock)
+
+
+class SubgraphEventSource(GeyserEventSource):
+    """
+    Paged subgraph queries, one geyser at a time
+    """
+
+    name = "subgraph"
+
+    def indexed_block(self):
+        return fetch_indexed_block()
+
+    def fetch(self, geyserAddresses, startBlock, endBlock):
+        events = {}
+        for address in geyserAddresses:
+            data = fetch_all_geyser_events(str(address), startBlock, endBlock)
+            events[str(address)] = [
+                parse_subgraph_event("Staked", e) for e in data["stakes"]
+            ] + [parse_subgraph_event("Unstaked", e) for e in data["unstakes"]]
+        return events
+
+
+class FileEventSource(GeyserEventSource):
+    """
+    Events recorded to a local JSON fixture, geyser -> event[], for running the rewards pipeline offline
+    """
+
+    name = "file"
+    persistent = False
+
+    def __init__(self, fileName=None):
+        if fileName is None:
+            fileName = rewards_config.eventFixtureFile
+        self.fileName = fileName
+        self.events = None
+
+    def fetch(self, geyserAddresses, startBlock, endBlock):
+        if self.events is None:
+            with open(self.fileName) as f:
+                self.events = json.load(f)
+        return {
+            str(address): [
+                e
+                for e in self.events.get(str(address), [])
+                if startBlock <= e["blockNumber"] <= endBlock
+            ]
+            for address in geyserAddresses
+        }
+
+
+eventSources = {
+    source.name: source
+    for source in [RpcEventSource, SubgraphEventSource, FileEventSource]
+}
+
+
+def get_event_source(name=None):
+    if name is None:
+        name = rewards_config.eventSource
+    return eventSources[name]()
+
+
+def write_event_fixture(fileName, events):
+    """
+    Record geyser -> event[] from any source, to be replayed with FileEventSource
+    """
+    os.makedirs(os.path.dirname(fileName) or ".", exist_ok=True)
+    with open(fileName, "w") as outfile:
+        json.dump(events, outfile)
+
+
+def parse_geyser_log(log):
+    return {
+        "event": log["event"],
+        "user": log["args"]["user"],
+        "amount": log["args"]["amount"],
+        "total": log["args"]["total"],
+        "timestamp": log["args"]["timestamp"],
+        "blockNumber": log["blockNumber"],
+        "logIndex": log["logIndex"],
+    }
+
+
+def parse_subgraph_event(eventName, event):
+    """
+    Subgraph event ids are <transaction hash>-<log index>
+    """
+    logIndex = 0
+    if "-" in event["id"]:
+        logIndex = int(event["id"].split("-")[-1])
+    return {
+        "event": eventName,
+        "user": web3.toChecksumAddress(event["user"]),
+        "amount": int(event["amount"]),
+        "total": int(event["total"]),
+        "timestamp": int(event["timestamp"]),
+        "blockNumber": int(event["blockNumber"]),
+        "logIndex": logIndex,
+    }
+
+
+def fetch_geyser_events(geyserAddresses, startBlock, endBlock):
+    """
+    Fetch Staked and Unstaked events for all given geysers between startBlock and endBlock (inclusive)
+    Each window is a single getLogs call covering both event topics for every geyser, demultiplexed locally
+    Window sizes adapt to the result density of the geysers, windows are fetched in parallel
+    geyser -> event[]
+    """
+    contract = web3.eth.contract(abi=BadgerGeyser.abi)
+    eventTypes = {
+        "Staked": contract.events.Staked(),
+        "Unstaked": contract.events.Unstaked(),
+    }
+    topics = {
+        web3.keccak(
+            text="{}(address,uint256,uint256,uint256,uint256,bytes)".format(name)
+        ).hex(): name
+        for name in eventTypes
+    }
+    addresses = [web3.toChecksumAddress(str(a)) for a in geyserAddresses]
+    events = {str(address): [] for address in geyserAddresses}
+    byChecksum = {a: str(g) for a, g in zip(addresses, geyserAddresses)}
+
+    logs = get_logs_parallel(
+        ",".join(sorted(addresses)),
+        {"address": addresses, "topics": [list(topics.keys())]},
+        startBlock,
+        endBlock,
+    )
+    for log in logs:
+        name = topics[log["topics"][0].hex()]
+        decoded = eventTypes[name].processLog(log)
+        events[byChecksum[decoded["address"]]].append(parse_geyser_log(decoded))
+    return events
@@ -0,0 +1,128 @@
+import json
+import os
+
+from brownie import *
+from config.rewards_config import rewards_config
+from rich.console import Console
+
+console = Console()
+
+
+class GeyserEventStore:
+    """
+    Persistent local store of Staked / Unstaked events, one file per geyser and event source.
+    Each file records the block range it covers. Subsequent fetches only request blocks after the last persisted height,
+    re-requesting the most recent `confirmations` blocks so that events dropped or moved by a reorg are replaced.
+    """
+
+    def __init__(self, directory=None, confirmations=None, source="rpc"):
+        if directory is None:
+            directory = rewards_config.eventStoreDir
+        if confirmations is None:
+            confirmations = rewards_config.eventStoreConfirmations
+        self.directory = directory
+        self.confirmations = confirmations
+        self.source = source
+
+    def path_for(self, geyserAddress):
+        return os.path.join(
+            self.directory,
+            "events-{}-{}-{}.json".format(self.source, chain.id, str(geyserAddress)),
+        )
+
+    def load(self, geyserAddress):
+        path = self.path_for(geyserAddress)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, geyserAddress, record):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(geyserAddress)
+
+        # Write to a temporary file first, a partially written store must never be read back
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as outfile:
+            json.dump(record, outfile)
+        os.replace(tmpPath, path)
+
+    def get_events(self, geyserAddress, startBlock, endBlock, fetch):
+        """
+        Return all events for the geyser between startBlock and endBlock (inclusive), fetching only what is not yet stored
+        fetch(fromBlock, toBlock) -> event[]
+        """
+        return self.get_events_for_all(
+            [geyserAddress],
+            startBlock,
+            endBlock,
+            lambda addresses, fromBlock, toBlock: {
+                str(geyserAddress): fetch(fromBlock, toBlock)
+            },
+        )[str(geyserAddress)]
+
+    def get_events_for_all(
+        self, geyserAddresses, startBlock, endBlock, fetch, indexedBlock=None
+    ):
+        """
+        Return geyser -> event[] for all geysers between startBlock and endBlock (inclusive)
+        Missing blocks for every geyser are requested with a single fetch over the union of their ranges
+        fetch(geyserAddresses, fromBlock, toBlock) -> geyser -> event[]
+        A source that lags the chain gives the latest block it has indexed, blocks after it are not recorded as covered
+        """
+        records = {}
+        fetchFrom = {}
+        for geyserAddress in geyserAddresses:
+            geyserAddress = str(geyserAddress)
+            record = self.load(geyserAddress)
+
+            # Nothing usable stored, fetch the whole range
+            if not record or record["startBlock"] > startBlock:
+                record = {
+                    "geyser": geyserAddress,
+                    "startBlock": startBlock,
+                    "endBlock": startBlock - 1,
+                    "events": [],
+                }
+                fetchFrom[geyserAddress] = startBlock
+
+            # Blocks within the confirmation depth of the stored height may have been reorged, fetch them again
+            else:
+                fetchFrom[geyserAddress] = max(
+                    record["startBlock"], record["endBlock"] - self.confirmations + 1
+                )
+            records[geyserAddress] = record
+
+        toFetch = [g for g in records if endBlock >= fetchFrom[g]]
+        if toFetch:
+            fromBlock = min(fetchFrom[g] for g in toFetch)
+            console.print(
+                "[grey]Event store: fetch {} geysers ({} -> {})[/grey]".format(
+                    len(toFetch), fromBlock, endBlock
+                )
+            )
+            fetched = fetch(toFetch, fromBlock, endBlock)
+
+            for geyserAddress in toFetch:
+                record = records[geyserAddress]
+                since = fetchFrom[geyserAddress]
+                kept = [e for e in record["events"] if e["blockNumber"] < since]
+                new = [
+                    e
+                    for e in fetched.get(geyserAddress, [])
+                    if e["blockNumber"] >= since
+                ]
+                record["events"] = kept + new
+                record["endBlock"] = (
+                    endBlock if indexedBlock is None else min(endBlock, indexedBlock)
+                )
+                self.save(geyserAddress, record)
+
+        return {
+            geyserAddress: [
+                e
+                for e in record["events"]
+                if startBlock <= e["blockNumber"] <= endBlock
+            ]
+            for geyserAddress, record in records.items()
+        }
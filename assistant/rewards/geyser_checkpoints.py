@@ -0,0 +1,65 @@
+import json
+import os
+
+from brownie import *
+from config.rewards_config import rewards_config
+from rich.console import Console
+
+console = Console()
+
+
+class GeyserCheckpointStore:
+    """
+    Persisted BadgerGeyserMock state at the end of a rewards cycle, keyed by geyser and end block
+    A later cycle can load the latest checkpoint before its start block and only replay the actions after it
+    """
+
+    def __init__(self, directory=None, keep=None):
+        if directory is None:
+            directory = rewards_config.checkpointDir
+        if keep is None:
+            keep = rewards_config.checkpointsKept
+        self.directory = directory
+        self.keep = keep
+
+    def prefix_for(self, geyserAddress):
+        return "checkpoint-{}-{}-".format(chain.id, str(geyserAddress))
+
+    def path_for(self, geyserAddress, block):
+        return os.path.join(
+            self.directory, "{}{}.json".format(self.prefix_for(geyserAddress), block)
+        )
+
+    def blocks_for(self, geyserAddress):
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = self.prefix_for(geyserAddress)
+        blocks = []
+        for fileName in os.listdir(self.directory):
+            if fileName.startswith(prefix) and fileName.endswith(".json"):
+                blocks.append(int(fileName[len(prefix) : -len(".json")]))
+        return sorted(blocks)
+
+    def latest(self, geyserAddress, maxBlock):
+        """
+        Load the most recent checkpoint at or before maxBlock, if any
+        """
+        blocks = [b for b in self.blocks_for(geyserAddress) if b <= maxBlock]
+        if not blocks:
+            return None
+        with open(self.path_for(geyserAddress, blocks[-1])) as f:
+            return json.load(f)
+
+    def save(self, geyserAddress, block, endTime, state):
+        os.makedirs(self.directory, exist_ok=True)
+        checkpoint = dict(state, geyser=str(geyserAddress), block=block, endTime=endTime)
+
+        path = self.path_for(geyserAddress, block)
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as outfile:
+            json.dump(checkpoint, outfile)
+        os.replace(tmpPath, path)
+
+        # Prune old checkpoints
+        for old in self.blocks_for(geyserAddress)[: -self.keep]:
+            os.remove(self.path_for(geyserAddress, old))
@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from brownie import *
+from config.rewards_config import rewards_config
+from requests.exceptions import ConnectionError, Timeout
+from rich.console import Console
+from tqdm import tqdm
+
+console = Console()
+
+# Error messages returned by providers when a getLogs range yields too many results (Infura -32005, Alchemy)
+tooManyResultsMessages = [
+    "query returned more than",
+    "log response size exceeded",
+]
+
+# Error messages for rate limits and overloaded nodes, which a retry of the same range avoids
+transientMessages = [
+    "429",
+    "too many requests",
+    "rate limit",
+    "request rate exceeded",
+]
+
+
+def is_window_error(e):
+    """
+    Is this an error that a smaller block range would avoid?
+    """
+    message = str(e).lower()
+    return any(m in message for m in tooManyResultsMessages)
+
+
+def is_transient_error(e):
+    """
+    Is this a network or rate limit error, to be retried without changing the range?
+    """
+    if isinstance(e, (Timeout, ConnectionError)):
+        return True
+    message = str(e).lower()
+    return any(m in message for m in transientMessages)
+
+
+class AdaptiveBlockWindow:
+    """
+    Block span for getLogs calls, learned per contract (or set of contracts)
+    The span doubles while results stay below the target and halves whenever the provider rejects a range
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = rewards_config.blockWindowFile
+        self.path = path
+        self.initialSpan = rewards_config.blockWindowInitialSpan
+        self.maxSpan = rewards_config.blockWindowMaxSpan
+        self.targetResults = rewards_config.blockWindowTargetResults
+        self.spans = {}
+        self.lock = threading.Lock()
+
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.spans = json.load(f)
+
+    def span(self, key):
+        return self.spans.get(key, self.initialSpan)
+
+    def shrink(self, key):
+        with self.lock:
+            self.spans[key] = max(1, self.span(key) // 2)
+            self.save()
+
+    def record(self, key, span, numResults):
+        """
+        Record the result count of a completed range of the given span
+        """
+        # Only grow from full-size windows, the final partial window of a scan says little about density
+        with self.lock:
+            if span >= self.span(key) and numResults < self.targetResults:
+                self.spans[key] = min(self.maxSpan, self.span(key) * 2)
+                self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as outfile:
+            json.dump(self.spans, outfile)
+
+
+blockWindows = None
+
+
+def get_block_windows():
+    global blockWindows
+    if blockWindows is None:
+        blockWindows = AdaptiveBlockWindow()
+    return blockWindows
+
+
+def get_logs_in_range(
+    key, filterParams, startBlock, endBlock, window=None, showProgress=True
+):
+    """
+    Fetch all logs matching filterParams between startBlock and endBlock (inclusive) using an adaptive block window
+    """
+    if window is None:
+        window = get_block_windows()
+
+    logs = []
+    start = startBlock
+    retries = 0
+
+    with tqdm(
+        total=max(0, endBlock - startBlock + 1), disable=not showProgress
+    ) as progress:
+        while start <= endBlock:
+            span = window.span(key)
+            end = min(start + span - 1, endBlock)
+
+            try:
+                result = web3.eth.getLogs(
+                    dict(filterParams, fromBlock=start, toBlock=end)
+                )
+            except Exception as e:
+                # Transient errors say nothing about the range, the learned span is kept
+                if is_transient_error(e) and retries < rewards_config.logFetchRetries:
+                    retries += 1
+                    time.sleep(rewards_config.logFetchRetryDelay * 2 ** (retries - 1))
+                    continue
+                if span == 1 or not is_window_error(e):
+                    raise
+                window.shrink(key)
+                if rewards_config.debug:
+                    console.log(
+                        "getLogs {} -> {} rejected, span reduced to {}".format(
+                            start, end, window.span(key)
+                        )
+                    )
+                continue
+
+            retries = 0
+            window.record(key, end - start + 1, len(result))
+            logs.extend(result)
+            progress.update(end - start + 1)
+            start = end + 1
+
+    return logs
+
+
+def log_order(log):
+    return (log["blockNumber"], log["logIndex"])
+
+
+class WorkCursor:
+    """
+    Hands out (fromBlock, toBlock) units to workers as they become free
+    Each unit is cut at the current learned span when it is taken, so spans learned early in a scan apply to the rest of it
+    A unit is also capped at the range split evenly across workers, so that short ranges still give every worker work
+    """
+
+    def __init__(self, key, startBlock, endBlock, window, workers):
+        self.key = key
+        self.start = startBlock
+        self.endBlock = endBlock
+        self.window = window
+        self.maxSpan = max(1, math.ceil((endBlock - startBlock + 1) / workers))
+        self.lock = threading.Lock()
+
+    def next_unit(self):
+        """
+        The next unit, or None when the whole range has been handed out
+        """
+        with self.lock:
+            if self.start > self.endBlock:
+                return None
+
+            span = min(self.window.span(self.key), self.maxSpan)
+            unit = (self.start, min(self.start + span - 1, self.endBlock))
+            self.start += span
+            return unit
+
+
+def get_logs_parallel(
+    key, filterParams, startBlock, endBlock, window=None, workers=None
+):
+    """
+    Fetch all logs matching filterParams between startBlock and endBlock (inclusive) with a bounded number of requests in flight
+    Workers take units from a shared cursor, each unit still adapts its window on provider errors
+    Logs are returned in (blockNumber, logIndex) order
+    """
+    if window is None:
+        window = get_block_windows()
+    if workers is None:
+        workers = rewards_config.logFetchWorkers
+
+    cursor = WorkCursor(key, startBlock, endBlock, window, workers)
+    progress = tqdm(total=max(0, endBlock - startBlock + 1))
+
+    def fetch_units():
+        logs = []
+        unit = cursor.next_unit()
+        while unit:
+            (start, end) = unit
+            logs.extend(
+                get_logs_in_range(
+                    key, filterParams, start, end, window, showProgress=False
+                )
+            )
+            progress.update(end - start + 1)
+            unit = cursor.next_unit()
+        return logs
+
+    logs = []
+    with progress, ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(lambda i: fetch_units(), range(workers)):
+            logs.extend(result)
+
+    return sorted(logs, key=log_order)
@@ -1,9 +1,9 @@
-from itertools import zip_longest
-
 from brownie import *
 from eth_utils import encode_hex
 from eth_utils.hexadecimal import encode_hex
 from helpers.constants import *
+from helpers.keccak import hash_hexstrs, hex_to_bytes
+from helpers.merkle import MerkleTree, verify_proofs
 from rich.console import Console
 
 console = Console()
@@ -13,51 +13,6 @@ Convert merkle_tree
 """
 
 
-class MerkleTree:
-    def __init__(self, elements):
-        self.elements = sorted(set(web3.keccak(hexstr=el) for el in elements))
-        self.layers = MerkleTree.get_layers(self.elements)
-
-        # console.log(self.elements, self.layers)
-
-    @property
-    def root(self):
-        return self.layers[-1][0]
-
-    def get_proof(self, el):
-        el = web3.keccak(hexstr=el)
-        idx = self.elements.index(el)
-        proof = []
-        for layer in self.layers:
-            pair_idx = idx + 1 if idx % 2 == 0 else idx - 1
-            if pair_idx < len(layer):
-                proof.append(encode_hex(layer[pair_idx]))
-            idx //= 2
-        return proof
-
-    @staticmethod
-    def get_layers(elements):
-        layers = [elements]
-        while len(layers[-1]) > 1:
-            layers.append(MerkleTree.get_next_layer(layers[-1]))
-        return layers
-
-    @staticmethod
-    def get_next_layer(elements):
-        return [
-            MerkleTree.combined_hash(a, b)
-            for a, b in zip_longest(elements[::2], elements[1::2])
-        ]
-
-    @staticmethod
-    def combined_hash(a, b):
-        if a is None:
-            return b
-        if b is None:
-            return a
-        return web3.keccak(b"".join(sorted([a, b])))
-
-
 def rewards_to_merkle_tree(rewards, startBlock, endBlock, geyserRewards):
     (nodes, encodedNodes, entries) = rewards.to_merkle_format()
 
@@ -79,11 +34,13 @@ def rewards_to_merkle_tree(rewards, startBlock, endBlock, geyserRewards):
         "cycle": nodes[0]["cycle"],
         "startBlock": str(startBlock),
         "endBlock": str(endBlock),
-        "tokenTotals": rewards.totals.toDict(),
+        "tokenTotals": rewards.totals,
         "claims": {},
         "metadata": {},
     }
 
+    proofs = tree.get_proofs(encodedNodes)
+
     for entry in entries:
         node = entry["node"]
         encoded = entry["encoded"]
@@ -94,12 +51,12 @@ def rewards_to_merkle_tree(rewards, startBlock, endBlock, geyserRewards):
             "cycle": hex(node["cycle"]),
             "tokens": node["tokens"],
             "cumulativeAmounts": node["cumulativeAmounts"],
-            "proof": tree.get_proof(encodedNodes[node["index"]]),
+            "proof": proofs[node["index"]],
             "node": encoded,
         }
 
     for user, data in geyserRewards.metadata.items():
-        distribution["metadata"][user] = data.toDict()
+        distribution["metadata"][user] = dict(data)
 
     print(f"merkle root: {encode_hex(tree.root)}")
 
@@ -109,3 +66,17 @@ def rewards_to_merkle_tree(rewards, startBlock, endBlock, geyserRewards):
     # console.log(distribution)
 
     return distribution
+
+
+def verify_rewards_tree(tree):
+    """
+    Users whose claim proof does not verify against the tree's merkle root
+    """
+    users = list(tree["claims"])
+    claims = [tree["claims"][user] for user in users]
+    results = verify_proofs(
+        hex_to_bytes(tree["merkleRoot"]),
+        hash_hexstrs([claim["node"] for claim in claims]),
+        [claim["proof"] for claim in claims],
+    )
+    return [user for user, valid in zip(users, results) if not valid]
@@ -1,18 +1,52 @@
 import json
-
-from assistant.rewards.aws_utils import download, upload
-from assistant.rewards.calc_stakes import calc_geyser_stakes
-from assistant.rewards.merkle_tree import rewards_to_merkle_tree
-from assistant.rewards.rewards_checker import compare_rewards
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from assistant.rewards.aws_utils import (
+    download_bytes,
+    missingKeyErrors,
+    open_download,
+    upload,
+)
+from assistant.rewards.block_cache import get_block_timestamps
+from assistant.rewards.calc_stakes import (
+    GeyserSnapshot,
+    calc_geyser_stakes_task,
+    collect_geyser_events,
+    globalStartBlock,
+    init_geyser_worker,
+)
+from assistant.rewards.geyser_checkpoints import GeyserCheckpointStore
+from assistant.rewards.merkle_tree import rewards_to_merkle_tree, verify_rewards_tree
+from assistant.rewards.rewards_checker import (
+    compare_rewards,
+    diff_claim_nodes,
+    diff_cumulative_claims,
+)
+from assistant.rewards.rewards_binary import binary_filename, save_rewards_tree_binary
+from assistant.rewards.rewards_file import (
+    load_rewards_tree_file,
+    write_verified_rewards_tree,
+)
+from assistant.rewards.rewards_cache import RewardsFileCache
+from assistant.rewards.rewards_layers import (
+    decode_layers_tree,
+    layers_filename,
+    save_rewards_tree_layers,
+)
 from assistant.rewards.RewardsList import RewardsList
 from brownie import *
+from botocore.exceptions import ClientError
 from brownie.network.gas.strategies import GasNowStrategy
 from config.rewards_config import rewards_config
 from eth_abi import decode_single, encode_single
 from eth_abi.packed import encode_abi_packed
+from eth_utils import encode_hex
+from helpers.merkle import MerkleTree
 from helpers.time_utils import hours
 from rich.console import Console
 from scripts.systems.badger_system import BadgerSystem
+from tabulate import tabulate
 
 gas_strategy = GasNowStrategy("fast")
 
@@ -53,10 +87,37 @@ def calc_geyser_rewards(badger, periodStartBlock, endBlock, cycle):
     """
     rewardsByGeyser = {}
 
+    # Resolve all block timestamps used in this cycle in one batch, including the checkpoint block
+    get_block_timestamps(
+        [periodStartBlock, endBlock - rewards_config.eventStoreConfirmations, endBlock]
+    )
+
+    # Fetch events for all geysers in a single pass
+    events = collect_geyser_events(badger.geysers, globalStartBlock, endBlock)
+
     # For each Geyser, get a list of user to weights
-    for key, geyser in badger.geysers.items():
-        geyserRewards = calc_geyser_stakes(key, geyser, periodStartBlock, endBlock)
-        rewardsByGeyser[key] = geyserRewards
+    # Geysers are independent, so each is processed in its own worker, from data read here
+    tasks = [
+        (key, GeyserSnapshot.read(geyser), periodStartBlock, endBlock, events[key])
+        for key, geyser in badger.geysers.items()
+    ]
+    workers = min(rewards_config.geyserWorkers, len(tasks))
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=init_geyser_worker
+        ) as executor:
+            results = list(executor.map(calc_geyser_stakes_task, tasks))
+    else:
+        results = [calc_geyser_stakes_task(task) for task in tasks]
+
+    # Results are merged in geyser order, regardless of the order workers finish in
+    # Checkpoints are only written from this process
+    checkpoints = GeyserCheckpointStore()
+    for task, (geyserRewards, saves) in zip(tasks, results):
+        rewardsByGeyser[task[0]] = geyserRewards
+        for save in saves:
+            checkpoints.save(*save)
 
     return sum_rewards(rewardsByGeyser, cycle, badger.badgerTree)
 
@@ -67,23 +128,13 @@ def calc_harvest_meta_farm_rewards(badger, startBlock, endBlock):
 
 
 def process_cumulative_rewards(current, new: RewardsList):
-    result = RewardsList(new.cycle, new.badgerTree)
-
-    # Add new rewards
-    for user, claims in new.claims.items():
-        for token, claim in claims.items():
-            result.increase_user_rewards(user, token, claim)
-
-    # Add existing rewards
-    for user, userData in current["claims"].items():
-        for i in range(len(userData["tokens"])):
-            token = userData["tokens"][i]
-            amount = userData["cumulativeAmounts"][i]
-            # print(user, token, amount)
-            result.increase_user_rewards(user, token, int(amount))
-
-    # result.printState()
-    return result
+    """
+    Add new rewards to the cumulative rewards of the current tree
+    Only users with new rewards are updated, every other user's amounts are carried over as loaded
+    """
+    if not isinstance(current, RewardsList):
+        current = RewardsList.from_rewards_tree(current)
+    return current.merge_cumulative(new)
 
 
 def combine_rewards(list, cycle, badgerTree):
@@ -118,6 +169,16 @@ def fetchCurrentMerkleData(badger):
     }
 
 
+def fetchPendingMerkleData(badger):
+    pendingMerkleData = badger.badgerTree.getPendingMerkleData()
+    return {
+        "root": str(pendingMerkleData[0]),
+        "contentHash": str(pendingMerkleData[1]),
+        "lastUpdateTime": pendingMerkleData[2],
+        "blockNumber": int(pendingMerkleData[3]),
+    }
+
+
 def getNextCycle(badger):
     return badger.badgerTree.currentCycle() + 1
 
@@ -126,6 +187,26 @@ def hash(value):
     return web3.toHex(web3.keccak(text=value))
 
 
+def download_rewards_tree(fileName):
+    """
+    Prefer the layers sidecar, older cycles only have the JSON file
+    Both are read through the local cache. A missing sidecar is remembered, so an older cycle costs one S3 miss in total
+    Proofs of a published tree aren't needed to build or verify the next one
+    """
+    cache = RewardsFileCache()
+    layersFileName = layers_filename(fileName)
+    if not cache.contains(fileName) and not cache.is_missing(layersFileName):
+        try:
+            return decode_layers_tree(download_bytes(layersFileName))
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in missingKeyErrors:
+                raise
+            cache.mark_missing(layersFileName)
+
+    with open_download(fileName) as f:
+        return json.load(f)
+
+
 def fetch_current_rewards_tree(badger, print_output=False):
     # TODO Files should be hashed and signed by keeper to prevent tampering
     # TODO How will we upload addresses securely?
@@ -140,7 +221,7 @@ def fetch_current_rewards_tree(badger, print_output=False):
             + " =====[/bold yellow]"
         )
 
-    currentTree = json.loads(download(pastFile))
+    currentTree = download_rewards_tree(pastFile)
 
     # Invariant: File shoulld have same root as latest
     assert currentTree["merkleRoot"] == merkle["root"]
@@ -202,11 +283,17 @@ def generate_rewards_in_range(badger, startBlock, endBlock):
 
     print("Uploading to file " + contentFileName)
     # TODO: Upload file to AWS & serve from server
-    with open(contentFileName, "w") as outfile:
-        json.dump(merkleTree, outfile)
+    # Proofs are checked on the in-memory tree before it is streamed to disk, the tree is used from here on
+    contentSha256 = write_verified_rewards_tree(merkleTree, contentFileName)
+    console.log({"contentFile": contentFileName, "contentSha256": contentSha256})
+
+    # The binary sidecar is kept locally only, for reloading the tree from disk
+    save_rewards_tree_binary(merkleTree, binary_filename(contentFileName))
 
-    with open(contentFileName) as f:
-        after_file = json.load(f)
+    # Published next to the JSON: claims without proofs, and the tree stored once as layers for claim lookups
+    layersFileName = layers_filename(contentFileName)
+    if not save_rewards_tree_layers(merkleTree, layersFileName):
+        layersFileName = None
 
     # Sanity check new rewards file
     compare_rewards(
@@ -214,17 +301,110 @@ def generate_rewards_in_range(badger, startBlock, endBlock):
         startBlock,
         endBlock,
         currentRewards,
-        after_file,
+        merkleTree,
         currentMerkleData["contentHash"],
     )
 
     return {
         "contentFileName": contentFileName,
+        "layersFileName": layersFileName,
         "merkleTree": merkleTree,
         "rootHash": rootHash,
     }
 
 
+def verify_pending_rewards(badger, startBlock, endBlock):
+    """
+    Verify the pending root by recomputing only the proposed range
+    The range is the proposal's own, it must start at startBlock (the block after the last claim) and not end after endBlock (the chain head)
+    Geysers resume from the checkpoints of the last cycle and no tree is written
+    The published JSON is checked claim by claim, proof by proof, and against the same invariants as compare_rewards
+    """
+    pendingMerkleData = fetchPendingMerkleData(badger)
+    proposedFile = content_hash_to_filename(pendingMerkleData["contentHash"])
+    console.print(
+        "[bold yellow]===== Verifying Proposed Rewards "
+        + proposedFile
+        + " =====[/bold yellow]"
+    )
+    # The JSON is what users claim from, so it is checked rather than the binary sidecar
+    with open_download(proposedFile) as f:
+        proposedTree = json.load(f)
+
+    nextCycle = getNextCycle(badger)
+    proposedStartBlock = int(proposedTree["startBlock"])
+    proposedEndBlock = int(proposedTree["endBlock"])
+    rangeValid = proposedStartBlock == startBlock <= proposedEndBlock <= endBlock
+    if not rangeValid:
+        console.print(
+            "[red]Proposed range {} -> {} does not start at {} or ends after {}[/red]".format(
+                proposedStartBlock, proposedEndBlock, startBlock, endBlock
+            )
+        )
+        return {
+            "verified": False,
+            "merkleRoot": None,
+            "rootHash": pendingMerkleData["contentHash"],
+            "cycle": nextCycle,
+        }
+
+    currentMerkleData = fetchCurrentMerkleData(badger)
+    currentRewards = fetch_current_rewards_tree(badger)
+    geyserRewards = calc_geyser_rewards(
+        badger, proposedStartBlock, proposedEndBlock, nextCycle
+    )
+    cumulativeRewards = process_cumulative_rewards(currentRewards, geyserRewards)
+
+    # Only the root is needed, not the proofs
+    (nodes, encodedNodes, entries) = cumulativeRewards.to_merkle_format()
+    merkleRoot = encode_hex(MerkleTree(encodedNodes).root)
+
+    mismatches = diff_cumulative_claims(
+        cumulativeRewards.claims, proposedTree["claims"]
+    )
+    for (user, expected, proposed) in mismatches[:20]:
+        console.print(
+            "[red]Claim mismatch for {}: expected {}, proposed {}[/red]".format(
+                user, expected, proposed
+            )
+        )
+    nodeMismatches = diff_claim_nodes(entries, proposedTree["claims"])
+    invalidProofs = verify_rewards_tree(proposedTree)
+    for user in (nodeMismatches + invalidProofs)[:20]:
+        console.print("[red]Claim node or proof mismatch for {}[/red]".format(user))
+
+    checks = [
+        ["cycle", int(proposedTree["cycle"]) == nextCycle],
+        ["user claims", not mismatches],
+        ["claim nodes", not nodeMismatches],
+        ["claim proofs", not invalidProofs],
+        [
+            "merkle root",
+            merkleRoot == pendingMerkleData["root"] == proposedTree["merkleRoot"],
+        ],
+    ]
+    print(tabulate(checks, headers=["check", "passed"]))
+    verified = all(passed for (check, passed) in checks)
+
+    # Total never decreases and stays under the sanity cap, no user's claim decreases
+    if verified:
+        compare_rewards(
+            badger,
+            proposedStartBlock,
+            proposedEndBlock,
+            currentRewards,
+            proposedTree,
+            currentMerkleData["contentHash"],
+        )
+
+    return {
+        "verified": verified,
+        "merkleRoot": merkleRoot,
+        "rootHash": pendingMerkleData["contentHash"],
+        "cycle": nextCycle,
+    }
+
+
 def rootUpdater(badger, startBlock, endBlock, test=False):
     """
     Root Updater Role
@@ -255,6 +435,8 @@ def rootUpdater(badger, startBlock, endBlock, test=False):
     console.print("===== Root Updater Complete =====")
     if not test:
         upload(rewards_data["contentFileName"])
+        if rewards_data["layersFileName"]:
+            upload(rewards_data["layersFileName"])
         badgerTree.proposeRoot(
             rewards_data["merkleTree"]["merkleRoot"],
             rewards_data["rootHash"],
@@ -284,12 +466,34 @@ def guardian(badger: BadgerSystem, startBlock, endBlock, test=False):
         console.print("[bold yellow]===== Result: No Pending Root =====[/bold yellow]")
         return False
 
+    if rewards_config.fastGuardian:
+        verification = verify_pending_rewards(badger, startBlock, endBlock)
+        if not verification["verified"]:
+            console.print(
+                "[bold red]===== Result: Pending Root Mismatch =====[/bold red]"
+            )
+            return False
+
+        console.print("===== Guardian Complete =====")
+
+        # The rootUpdater has already published the files for the proposed root
+        if not test:
+            badgerTree.approveRoot(
+                verification["merkleRoot"],
+                verification["rootHash"],
+                verification["cycle"],
+                {"from": badger.guardian, "gas_price": gas_strategy},
+            )
+        return True
+
     rewards_data = generate_rewards_in_range(badger, startBlock, endBlock)
 
     console.print("===== Guardian Complete =====")
 
     if not test:
         upload(rewards_data["contentFileName"]),
+        if rewards_data["layersFileName"]:
+            upload(rewards_data["layersFileName"])
         badgerTree.approveRoot(
             rewards_data["merkleTree"]["merkleRoot"],
             rewards_data["rootHash"],
@@ -312,5 +516,4 @@ def content_hash_to_filename(contentHash):
 
 def load_content_file(contentHash):
     fileName = content_hash_to_filename(contentHash)
-    f = open(fileName,)
-    return json.load(f)
+    return load_rewards_tree_file(fileName)
@@ -0,0 +1,223 @@
+import json
+import struct
+
+from rich.console import Console
+
+console = Console()
+
+"""
+Columnar binary sidecar for the rewards tree
+
+Layout (big endian):
+    header      magic "BRWD", version u8
+    tree        merkleRoot bytes32, cycle u64, startBlock u64, endBlock u64
+    tokens      count u16, address * count, totals uint256 * count
+    addresses   count u32, address * count, sorted
+    columns     one column per field, each in address order:
+                    index u32, cycle u64,
+                    token count u8, token indices u8 (packed), amounts uint256 (packed),
+                    proof length u8, proof nodes bytes32 (packed),
+                    node length u16, nodes (packed)
+    metadata    length u32, JSON
+
+Addresses are stored as their 40 character hex text (checksum case preserved), which avoids re-checksumming on load
+"""
+
+MAGIC = b"BRWD"
+VERSION = 1
+
+
+def hex_bytes(value):
+    return bytes.fromhex(value[2:])
+
+
+def address_text(address):
+    assert len(address) == 42 and address.startswith("0x")
+    return address[2:].encode("ascii")
+
+
+def to_uint256(value):
+    return int(value).to_bytes(32, "big")
+
+
+def encode_rewards_tree(tree):
+    """
+    Encode a rewards tree (as written to JSON) to the binary format
+    """
+    tokens = list(tree["tokenTotals"].keys())
+    tokenIndexes = {token: i for i, token in enumerate(tokens)}
+
+    out = bytearray()
+    out += MAGIC + struct.pack(">B", VERSION)
+    out += hex_bytes(tree["merkleRoot"])
+    out += struct.pack(
+        ">QQQ", int(tree["cycle"]), int(tree["startBlock"]), int(tree["endBlock"])
+    )
+
+    out += struct.pack(">H", len(tokens))
+    out += b"".join(address_text(token) for token in tokens)
+    out += b"".join(to_uint256(tree["tokenTotals"][token]) for token in tokens)
+
+    users = sorted(tree["claims"].keys(), key=lambda user: user.lower())
+    claims = [tree["claims"][user] for user in users]
+    n = len(users)
+    out += struct.pack(">I", n)
+    out += b"".join(address_text(user) for user in users)
+
+    out += struct.pack(">{}I".format(n), *[int(c["index"], 16) for c in claims])
+    out += struct.pack(">{}Q".format(n), *[int(c["cycle"], 16) for c in claims])
+
+    out += bytes(len(c["tokens"]) for c in claims)
+    out += bytes(tokenIndexes[token] for c in claims for token in c["tokens"])
+    out += b"".join(
+        to_uint256(amount) for c in claims for amount in c["cumulativeAmounts"]
+    )
+
+    out += bytes(len(c["proof"]) for c in claims)
+    out += b"".join(hex_bytes(node) for c in claims for node in c["proof"])
+
+    nodes = [hex_bytes(c["node"]) for c in claims]
+    out += struct.pack(">{}H".format(n), *[len(node) for node in nodes])
+    out += b"".join(nodes)
+
+    metadata = json.dumps(tree["metadata"]).encode("utf-8")
+    out += struct.pack(">I", len(metadata)) + metadata
+    return bytes(out)
+
+
+def decode_rewards_tree(data, proofs=True):
+    """
+    Decode the binary format into the same structure as the JSON rewards tree
+    Without proofs, the proof and node columns are skipped, which is all most readers of a past tree need
+    """
+    view = memoryview(data)
+    if bytes(view[0:4]) != MAGIC:
+        raise ValueError("Not a binary rewards tree")
+    (version,) = struct.unpack_from(">B", view, 4)
+    if version != VERSION:
+        raise ValueError("Unsupported binary rewards tree version {}".format(version))
+    offset = 5
+
+    def take(length):
+        nonlocal offset
+        chunk = bytes(view[offset : offset + length])
+        offset += length
+        return chunk
+
+    def take_struct(fmt):
+        nonlocal offset
+        values = struct.unpack_from(fmt, view, offset)
+        offset += struct.calcsize(fmt)
+        return values
+
+    merkleRoot = "0x" + take(32).hex()
+    (cycle, startBlock, endBlock) = take_struct(">QQQ")
+
+    (numTokens,) = take_struct(">H")
+    tokenData = take(40 * numTokens).decode("ascii")
+    tokens = ["0x" + tokenData[i * 40 : (i + 1) * 40] for i in range(numTokens)]
+    totalsData = take(32 * numTokens)
+    tokenTotals = {
+        token: int.from_bytes(totalsData[i * 32 : (i + 1) * 32], "big")
+        for i, token in enumerate(tokens)
+    }
+
+    (n,) = take_struct(">I")
+    userData = take(40 * n).decode("ascii")
+    users = ["0x" + userData[i * 40 : (i + 1) * 40] for i in range(n)]
+
+    indexes = take_struct(">{}I".format(n))
+    cycles = take_struct(">{}Q".format(n))
+
+    tokenCounts = take(n)
+    tokenIndexes = take(sum(tokenCounts))
+    amountData = take(32 * len(tokenIndexes))
+
+    proofLengths = take(n)
+    proofData = take(32 * sum(proofLengths))
+
+    nodeLengths = take_struct(">{}H".format(n))
+    nodeData = take(sum(nodeLengths))
+
+    (metadataLength,) = take_struct(">I")
+    metadata = json.loads(take(metadataLength))
+
+    if proofs:
+        proofData = proofData.hex()
+        nodeData = nodeData.hex()
+
+    claims = []
+    tokenOffset = 0
+    proofOffset = 0
+    nodeOffset = 0
+    for i in range(n):
+        count = tokenCounts[i]
+        claim = {
+            "index": hex(indexes[i]),
+            "user": users[i],
+            "cycle": hex(cycles[i]),
+            "tokens": [
+                tokens[t] for t in tokenIndexes[tokenOffset : tokenOffset + count]
+            ],
+            "cumulativeAmounts": [
+                str(int.from_bytes(amountData[a * 32 : (a + 1) * 32], "big"))
+                for a in range(tokenOffset, tokenOffset + count)
+            ],
+        }
+        tokenOffset += count
+
+        if proofs:
+            claim["proof"] = [
+                "0x" + proofData[p * 64 : (p + 1) * 64]
+                for p in range(proofOffset, proofOffset + proofLengths[i])
+            ]
+            proofOffset += proofLengths[i]
+
+            claim["node"] = (
+                "0x" + nodeData[nodeOffset * 2 : (nodeOffset + nodeLengths[i]) * 2]
+            )
+            nodeOffset += nodeLengths[i]
+
+        claims.append((indexes[i], users[i], claim))
+
+    # Claims are ordered by index, as in the JSON file
+    claims.sort(key=lambda entry: entry[0])
+
+    return {
+        "merkleRoot": merkleRoot,
+        "cycle": cycle,
+        "startBlock": str(startBlock),
+        "endBlock": str(endBlock),
+        "tokenTotals": tokenTotals,
+        "claims": {user: claim for (index, user, claim) in claims},
+        "metadata": metadata,
+    }
+
+
+def binary_filename(fileName):
+    """
+    rewards-<chain>-<hash>.json -> rewards-<chain>-<hash>.bin
+    """
+    assert fileName.endswith(".json")
+    return fileName[: -len(".json")] + ".bin"
+
+
+def save_rewards_tree_binary(tree, fileName):
+    """
+    Write the binary sidecar for a rewards tree, if it can be encoded
+    Returns True if written. That the format round trips is checked in the tests, not on every cycle
+    """
+    try:
+        data = encode_rewards_tree(tree)
+    except (ValueError, KeyError, OverflowError, AssertionError, struct.error) as e:
+        console.print("[yellow]Binary rewards tree not written: {}[/yellow]".format(e))
+        return False
+
+    with open(fileName, "wb") as outfile:
+        outfile.write(data)
+    return True
+
+
+def load_rewards_tree_binary(fileName, proofs=True):
+    with open(fileName, "rb") as f:
+        return decode_rewards_tree(f.read(), proofs)
@@ -0,0 +1,212 @@
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+from config.rewards_config import rewards_config
+from rich.console import Console
+
+console = Console()
+
+
+class RewardsFileCache:
+    """
+    Local content-addressed cache for immutable rewards files
+    Content is stored under its sha256, with an index from file name to hash. Content is verified on every read
+    The least recently used entries are evicted once the cache grows past maxBytes
+
+    The directory is shared by the guardian and rootUpdater processes: the index is only rewritten on insert or eviction,
+    under a file lock, and reads record their access time on the content file rather than in the index
+    """
+
+    def __init__(self, directory=None, maxBytes=None):
+        if directory is None:
+            directory = rewards_config.rewardsCacheDir
+        if maxBytes is None:
+            maxBytes = rewards_config.rewardsCacheMaxBytes
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def blob_path(self, contentHash):
+        return os.path.join(self.directory, contentHash)
+
+    def load_index(self):
+        if not os.path.exists(self.index_path()):
+            return {}
+        with open(self.index_path()) as f:
+            return json.load(f)
+
+    def save_index(self, index):
+        os.makedirs(self.directory, exist_ok=True)
+        tmpPath = "{}.{}.tmp".format(self.index_path(), os.getpid())
+        with open(tmpPath, "w") as outfile:
+            json.dump(index, outfile)
+        os.replace(tmpPath, self.index_path())
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "index.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked_index(self):
+        """
+        Load the index for an update, holding the cache lock until it is saved
+        """
+        with self.locked():
+            index = self.load_index()
+            yield index
+            self.save_index(index)
+
+    def contains(self, fileName):
+        """
+        Whether fileName is indexed, without verifying its content
+        """
+        return fileName in self.load_index()
+
+    def missing_path(self):
+        return os.path.join(self.directory, "missing.json")
+
+    def load_missing(self):
+        if not os.path.exists(self.missing_path()):
+            return []
+        with open(self.missing_path()) as f:
+            return json.load(f)
+
+    def is_missing(self, fileName):
+        """
+        Whether fileName is known not to exist upstream
+        """
+        return fileName in self.load_missing()
+
+    def mark_missing(self, fileName):
+        """
+        Remember that fileName does not exist upstream. Names are content hashes, so it never will
+        """
+        with self.locked():
+            missing = self.load_missing()
+            if fileName not in missing:
+                missing.append(fileName)
+                tmpPath = "{}.{}.tmp".format(self.missing_path(), os.getpid())
+                with open(tmpPath, "w") as outfile:
+                    json.dump(missing, outfile)
+                os.replace(tmpPath, self.missing_path())
+
+    def last_access(self, entry):
+        path = self.blob_path(entry["sha256"])
+        return os.path.getmtime(path) if os.path.exists(path) else 0
+
+    def get_path(self, fileName):
+        """
+        Path of the cached content for fileName, or None if not cached or the cached content fails verification
+        """
+        entry = self.load_index().get(fileName)
+        if not entry:
+            return None
+
+        path = self.blob_path(entry["sha256"])
+        if not os.path.exists(path) or file_sha256(path) != entry["sha256"]:
+            console.print(
+                "[yellow]Cached {} failed verification, discarding[/yellow]".format(
+                    fileName
+                )
+            )
+            with self.locked_index() as index:
+                if index.get(fileName) == entry:
+                    self.remove(index, fileName)
+            return None
+
+        os.utime(path)
+        return path
+
+    def get(self, fileName):
+        """
+        Cached content for fileName, or None
+        """
+        path = self.get_path(fileName)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put_stream(self, fileName, chunks):
+        """
+        Write content arriving in chunks to the cache, hashing it on the way, returns the content path
+        Only one chunk is held in memory at a time
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        tmpPath = os.path.join(self.directory, "download.{}.tmp".format(os.getpid()))
+        with open(tmpPath, "wb") as outfile:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                outfile.write(chunk)
+        contentHash = digest.hexdigest()
+        path = self.blob_path(contentHash)
+
+        # Under the lock, so a concurrent eviction can't remove the content before it is indexed
+        with self.locked_index() as index:
+            if not os.path.exists(path):
+                os.replace(tmpPath, path)
+            else:
+                os.remove(tmpPath)
+                os.utime(path)
+
+            index[fileName] = {"sha256": contentHash, "size": size}
+            self.evict(index)
+        return path
+
+    def put(self, fileName, data):
+        self.put_stream(fileName, [data])
+
+    def remove(self, index, fileName):
+        entry = index.pop(fileName)
+
+        # Blobs may be shared by several names
+        if not any(e["sha256"] == entry["sha256"] for e in index.values()):
+            path = self.blob_path(entry["sha256"])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self, index):
+        """
+        Remove least recently used entries until the cache fits in maxBytes
+        """
+        byAccess = sorted(index.keys(), key=lambda name: self.last_access(index[name]))
+        total = sum(index[name]["size"] for name in index)
+        for fileName in byAccess:
+            if total <= self.maxBytes:
+                break
+            total -= index[fileName]["size"]
+            self.remove(index, fileName)
+
+    def open(self, fileName, download):
+        """
+        Open the cached content for fileName as a binary file, downloading it into the cache first if needed
+        download(fileName) yields the content in chunks, which go straight to disk
+        """
+        path = self.get_path(fileName)
+        if path is None:
+            path = self.put_stream(fileName, download(fileName))
+        else:
+            console.print("Using cached file: " + fileName)
+        return open(path, "rb")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
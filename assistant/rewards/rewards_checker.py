@@ -1,11 +1,17 @@
 from helpers.time_utils import days, hours
 from tabulate import tabulate
 from assistant.rewards.BadgerGeyserMock import BadgerGeyserMock
+from assistant.rewards.block_cache import get_block_timestamps
+from assistant.rewards.calc_stakes import collect_geyser_events
 from scripts.systems.badger_system import BadgerSystem
 from brownie import *
 from rich.console import Console
 from assistant.rewards.aws_utils import upload
+from assistant.rewards.merkle_tree import verify_rewards_tree
+from assistant.rewards.rewards_file import load_rewards_tree_file
+from assistant.rewards.rewards_layers import layers_filename
 import json
+import os
 import brownie
 from config.badger_config import badger_config, globalStartTime
 
@@ -21,8 +27,9 @@ def sec(amount):
 
 
 def get_distributed_in_range(key, geyser, startBlock, endBlock):
-    periodEndTime = web3.eth.getBlock(endBlock)["timestamp"]
-    periodStartTime = web3.eth.getBlock(startBlock)["timestamp"]
+    timestamps = get_block_timestamps([startBlock, endBlock])
+    periodEndTime = timestamps[endBlock]
+    periodStartTime = timestamps[startBlock]
 
     geyserMock = BadgerGeyserMock(key)
     distributionTokens = geyser.getDistributionTokens()
@@ -56,6 +63,23 @@ def getExpectedDistributionInRange(badger: BadgerSystem, startBlock, endBlock):
     # for key, dist in distributions.items():
 
 
+def get_geyser_activity_in_range(badger: BadgerSystem, startBlock, endBlock):
+    """
+    Count stake and unstake events across all geysers within the range
+    Events are read from the event store the rewards run has just filled, only the confirmation window is fetched again
+    """
+    events = collect_geyser_events(badger.geysers, startBlock, endBlock)
+    stakes = 0
+    unstakes = 0
+    for geyserEvents in events.values():
+        for event in geyserEvents:
+            if event["event"] == "Staked":
+                stakes += 1
+            else:
+                unstakes += 1
+    return (stakes, unstakes)
+
+
 def sum_claims(claims):
     total = 0
     for user, claim in claims.items():
@@ -88,6 +112,49 @@ def diff_rewards(
     print(tabulate(table, headers=["user", "a", "b", "diff", "% gained"],))
 
 
+def diff_cumulative_claims(expectedClaims, proposedClaims):
+    """
+    Compare expected cumulative claims (user -> token -> amount) against claims in a rewards tree
+    Returns (user, expected, proposed) for every user whose claims differ
+    """
+    mismatches = []
+    for user, tokens in expectedClaims.items():
+        expected = {token: int(amount) for token, amount in tokens.items()}
+        proposed = None
+        if user in proposedClaims:
+            claim = proposedClaims[user]
+            proposed = {
+                token: int(amount)
+                for token, amount in zip(claim["tokens"], claim["cumulativeAmounts"])
+            }
+        if expected != proposed:
+            mismatches.append((user, expected, proposed))
+
+    for user in proposedClaims:
+        if not user in expectedClaims:
+            mismatches.append((user, None, proposedClaims[user]))
+    return mismatches
+
+
+def diff_claim_nodes(entries, proposedClaims):
+    """
+    Users whose claim in a rewards tree doesn't carry the recomputed node, index and cycle
+    entries are the recomputed entries of RewardsList.to_merkle_format
+    """
+    mismatches = []
+    for entry in entries:
+        node = entry["node"]
+        claim = proposedClaims.get(node["user"])
+        if (
+            claim is None
+            or claim["node"] != entry["encoded"]
+            or int(claim["index"], 16) != node["index"]
+            or int(claim["cycle"], 16) != node["cycle"]
+        ):
+            mismatches.append(node["user"])
+    return mismatches
+
+
 def compare_rewards(
     badger: BadgerSystem,
     startBlock,
@@ -117,8 +184,9 @@ def compare_rewards(
         0
     ].amount
 
-    periodStartTime = web3.eth.getBlock(startBlock)["timestamp"]
-    periodEndTime = web3.eth.getBlock(endBlock)["timestamp"]
+    timestamps = get_block_timestamps([startBlock, endBlock])
+    periodStartTime = timestamps[startBlock]
+    periodEndTime = timestamps[endBlock]
 
     duration = periodEndTime - periodStartTime
     expectedInRange = totalExpected * duration // days(7)
@@ -132,6 +200,9 @@ def compare_rewards(
 
     # Expected gains must match up with the distributions from various rewards programs
     expectedGains = getExpectedDistributionInRange(badger, startBlock, endBlock)
+    (stakesInRange, unstakesInRange) = get_geyser_activity_in_range(
+        badger, startBlock, endBlock
+    )
 
     # Total claims must only increase
     sum_before = sum_claims(before)
@@ -141,6 +212,8 @@ def compare_rewards(
     table = []
     table.append(["block range", startBlock, endBlock])
     table.append(["duration", periodEndTime - periodStartTime, "-"])
+    table.append(["stakes in range", stakesInRange, "-"])
+    table.append(["unstakes in range", unstakesInRange, "-"])
     table.append(["sum before", sum_before, val(sum_before)])
     table.append(["sum after", sum_after, val(sum_after)])
     table.append(["expected gains", expectedGains, val(expectedGains)])
@@ -222,10 +295,12 @@ def compare_rewards(
 
 
 def push_rewards(badger: BadgerSystem, afterContentHash):
-    with open("rewards-1-" + afterContentHash + ".json") as f:
-        after_file = json.load(f)
+    fileName = "rewards-1-" + afterContentHash + ".json"
+    after_file = load_rewards_tree_file(fileName, proofs=False)
 
-    upload("rewards-1-" + afterContentHash + ".json")
+    upload(fileName)
+    if os.path.exists(layers_filename(fileName)):
+        upload(layers_filename(fileName))
     badger.badgerTree.proposeRoot(
         after_file["merkleRoot"],
         afterContentHash,
@@ -245,6 +320,10 @@ def test_claims(badger: BadgerSystem, startBlock, endBlock, before_file, after_f
     before = before_file["claims"]
     claims = after_file["claims"]
 
+    # Every proof is checked against the root up front, rather than by a reverted claim
+    invalidProofs = verify_rewards_tree(after_file)
+    assert not invalidProofs, "Invalid proofs for {}".format(invalidProofs[:20])
+
     # Total claims must only increase
     total_claimable = sum_claims(claims)
 
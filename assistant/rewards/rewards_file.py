@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+from assistant.rewards.merkle_tree import verify_rewards_tree
+from assistant.rewards.rewards_binary import binary_filename, load_rewards_tree_binary
+from rich.console import Console
+
+console = Console()
+
+# Top level keys of the rewards tree written entry by entry
+streamedKeys = ["claims", "metadata"]
+
+
+def iter_rewards_tree_chunks(merkleTree):
+    """
+    Serialize the rewards tree in chunks, one claim / metadata entry at a time
+    The concatenated chunks are byte-identical to json.dumps(merkleTree)
+    """
+    yield "{"
+    first = True
+    for key, value in merkleTree.items():
+        if not first:
+            yield ", "
+        first = False
+        yield json.dumps(key) + ": "
+
+        if key in streamedKeys and isinstance(value, dict):
+            yield "{"
+            firstEntry = True
+            for entryKey, entry in value.items():
+                prefix = "" if firstEntry else ", "
+                firstEntry = False
+                yield prefix + json.dumps(entryKey) + ": " + json.dumps(entry)
+            yield "}"
+        else:
+            yield json.dumps(value)
+    yield "}"
+
+
+def write_rewards_tree(merkleTree, fileName):
+    """
+    Stream the rewards tree to fileName one entry at a time, returning the sha256 of the written bytes
+    The tree itself is already in memory, this only avoids building its full JSON string as well
+    """
+    digest = hashlib.sha256()
+    with open(fileName, "wb") as outfile:
+        for chunk in iter_rewards_tree_chunks(merkleTree):
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            outfile.write(data)
+    return digest.hexdigest()
+
+
+def write_verified_rewards_tree(merkleTree, fileName):
+    """
+    Check every claim's proof against the root of the in-memory tree, then stream it to fileName
+    The file is the tree's JSON serialization, so the in-memory tree stands in for it from here on and it is not read back
+    Returns the sha256 of the written file
+    """
+    invalidProofs = verify_rewards_tree(merkleTree)
+    assert not invalidProofs, "{} has invalid proofs for {}".format(
+        fileName, invalidProofs[:20]
+    )
+    return write_rewards_tree(merkleTree, fileName)
+
+
+def load_rewards_tree_file(fileName, proofs=True):
+    """
+    Load a rewards tree from disk, from its binary sidecar when present
+    """
+    binaryFileName = binary_filename(fileName)
+    if os.path.exists(binaryFileName):
+        return load_rewards_tree_binary(binaryFileName, proofs)
+    with open(fileName) as f:
+        return json.load(f)
@@ -0,0 +1,202 @@
+import struct
+from functools import lru_cache
+
+from assistant.rewards.rewards_binary import decode_rewards_tree, encode_rewards_tree
+from config.rewards_config import rewards_config
+from eth_utils import encode_hex
+from helpers.keccak import build_layers, hash_hexstrs
+from helpers.merkle import leaf_proof
+from rich.console import Console
+
+console = Console()
+
+"""
+Layer-only rewards artifact
+
+Claims are stored without proofs, the merkle tree is stored once as its layers, and proofs are derived on demand
+
+Layout (big endian):
+    header      magic "BRWL", version u8
+    tree        length u32, binary rewards tree (see rewards_binary) with empty proofs
+    layers      count u8, per layer: node count u32, nodes bytes32 (packed), sorted leaves first
+    positions   count u32, leaf position u32 per claim in claim index order
+"""
+
+MAGIC = b"BRWL"
+VERSION = 1
+
+
+def rewards_tree_layers(tree):
+    """
+    Rebuild the merkle layers of a rewards tree from its claim nodes, checking the root
+    Returns (layers, positions), positions are leaf positions in claim index order
+    """
+    claims = sorted(tree["claims"].values(), key=lambda claim: int(claim["index"], 16))
+    leaves = hash_hexstrs([claim["node"] for claim in claims])
+    sortedLeaves = sorted(set(leaves))
+    layers = build_layers(sortedLeaves)
+
+    if encode_hex(layers[-1][0]) != tree["merkleRoot"]:
+        raise ValueError("Claims do not match the merkle root")
+
+    indexes = {leaf: i for i, leaf in enumerate(sortedLeaves)}
+    return (layers, [indexes[leaf] for leaf in leaves])
+
+
+def encode_rewards_layers(tree, layers, positions):
+    claims = {
+        user: dict(claim, proof=[]) for user, claim in tree["claims"].items()
+    }
+    treeData = encode_rewards_tree(dict(tree, claims=claims))
+
+    out = bytearray()
+    out += MAGIC + struct.pack(">B", VERSION)
+    out += struct.pack(">I", len(treeData)) + treeData
+
+    out += struct.pack(">B", len(layers))
+    for layer in layers:
+        out += struct.pack(">I", len(layer))
+        out += b"".join(layer)
+
+    out += struct.pack(">I", len(positions))
+    out += struct.pack(">{}I".format(len(positions)), *positions)
+    return bytes(out)
+
+
+def read_tree_data(view):
+    """
+    Returns the binary rewards tree held by a layers artifact, and the offset of its layers
+    """
+    if bytes(view[0:4]) != MAGIC:
+        raise ValueError("Not a rewards layers artifact")
+    (version,) = struct.unpack_from(">B", view, 4)
+    if version != VERSION:
+        raise ValueError("Unsupported rewards layers version {}".format(version))
+
+    (treeLength,) = struct.unpack_from(">I", view, 5)
+    return (bytes(view[9 : 9 + treeLength]), 9 + treeLength)
+
+
+def decode_layers_tree(data):
+    """
+    The rewards tree of a layers artifact without proofs or nodes, leaving the layers undecoded
+    """
+    (treeData, offset) = read_tree_data(memoryview(data))
+    return decode_rewards_tree(treeData, proofs=False)
+
+
+def decode_rewards_layers(data):
+    """
+    Returns (tree, layers, positions), tree claims have empty proofs
+    """
+    view = memoryview(data)
+    (treeData, offset) = read_tree_data(view)
+    tree = decode_rewards_tree(treeData)
+
+    (numLayers,) = struct.unpack_from(">B", view, offset)
+    offset += 1
+    layers = []
+    for i in range(numLayers):
+        (count,) = struct.unpack_from(">I", view, offset)
+        offset += 4
+        layerData = bytes(view[offset : offset + 32 * count])
+        layers.append([layerData[j * 32 : (j + 1) * 32] for j in range(count)])
+        offset += 32 * count
+
+    (numPositions,) = struct.unpack_from(">I", view, offset)
+    offset += 4
+    positions = list(struct.unpack_from(">{}I".format(numPositions), view, offset))
+    return (tree, layers, positions)
+
+
+def derive_proof(layers, position):
+    """
+    Proof for the leaf at position in the sorted leaves, one sibling per layer
+    """
+    return [encode_hex(node) for node in leaf_proof(layers, position)]
+
+
+class RewardsLayers:
+    """
+    A loaded layers artifact, resolving claims with proofs
+    Derived proofs are kept in an LRU cache
+    """
+
+    def __init__(self, tree, layers, positions, cacheSize=None):
+        if cacheSize is None:
+            cacheSize = rewards_config.proofCacheSize
+        self.tree = tree
+        self.layers = layers
+        self.positions = positions
+        self.get_proof = lru_cache(maxsize=cacheSize)(self.derive_user_proof)
+
+    @property
+    def merkleRoot(self):
+        return self.tree["merkleRoot"]
+
+    def derive_user_proof(self, user):
+        index = int(self.tree["claims"][user]["index"], 16)
+        return derive_proof(self.layers, self.positions[index])
+
+    def get_claim(self, user):
+        """
+        The user's claim as it appears in the full rewards tree, or None
+        """
+        claim = self.tree["claims"].get(user)
+        if claim is None:
+            return None
+        return dict(claim, proof=list(self.get_proof(user)))
+
+
+def layers_filename(fileName):
+    """
+    rewards-<chain>-<hash>.json -> rewards-<chain>-<hash>.layers
+    """
+    assert fileName.endswith(".json")
+    return fileName[: -len(".json")] + ".layers"
+
+
+def sample_claims(tree, count):
+    """
+    Up to count claims, evenly spaced in claim order
+    """
+    claims = list(tree["claims"].values())
+    step = max(1, len(claims) // max(1, count))
+    return claims[::step][:count]
+
+
+def save_rewards_tree_layers(tree, fileName):
+    """
+    Write the layers artifact for a rewards tree, if the root matches and a sample of claims derive their original proofs
+    Returns True if written. Resolving every claim from the decoded artifact is checked in the tests
+    """
+    try:
+        (layers, positions) = rewards_tree_layers(tree)
+        mismatched = [
+            claim["user"]
+            for claim in sample_claims(tree, rewards_config.layersCheckedClaims)
+            if derive_proof(layers, positions[int(claim["index"], 16)])
+            != claim["proof"]
+        ]
+        data = encode_rewards_layers(tree, layers, positions)
+    except (ValueError, KeyError, OverflowError, AssertionError, struct.error) as e:
+        console.print("[yellow]Rewards layers not written: {}[/yellow]".format(e))
+        return False
+
+    if mismatched:
+        console.print(
+            "[yellow]Rewards layers not written: proofs differ for {}[/yellow]".format(
+                mismatched[:20]
+            )
+        )
+        return False
+
+    with open(fileName, "wb") as outfile:
+        outfile.write(data)
+    return True
+
+
+def load_rewards_layers(fileName, cacheSize=None):
+    with open(fileName, "rb") as f:
+        (tree, layers, positions) = decode_rewards_layers(f.read())
+    return RewardsLayers(tree, layers, positions, cacheSize)
@@ -5,49 +5,124 @@ from rich.console import Console
 console = Console()
 
 url = subgraph_config["url"]
+headers = {}
+pageSize = subgraph_config["pageSize"]
 
+# Upper bound for open ended block ranges
+maxBlock = 2 ** 63 - 1
 
-def fetch_all_geyser_events(geyserId):
-    print("fetch_geyser_events", geyserId)
-    # Get all geysers
-    query = """
-    {
-    geysers {
+eventFields = "id, user, amount, total, timestamp, blockNumber, data"
+
+# Both event lists are paged independently, each with its own id cursor
+eventQueries = {
+    "stakes": "stakeEvents",
+    "unstakes": "unstakeEvents",
+}
+
+
+def get_endpoint():
+    return HTTPEndpoint(url, headers)
+
+
+def geyser_events_query(field):
+    return """
+    query geyserEvents($geyserId: ID!, $startBlock: BigInt!, $endBlock: BigInt!, $cursor: String!, $first: Int!) {
+    geyser(id: $geyserId) {
         id
         totalStaked
-        stakeEvents(orderBy: blockNumber) {
-        id, geyser {
-            id
-        }, user, amount, total, timestamp, blockNumber, data
-            }
-        unstakeEvents(orderBy: blockNumber) {
-        id, geyser {
-            id
-        }, user, amount, total, timestamp, blockNumber, data
+        events: %s(
+            first: $first,
+            orderBy: id,
+            orderDirection: asc,
+            where: {id_gt: $cursor, blockNumber_gte: $startBlock, blockNumber_lte: $endBlock}
+        ) {
+        %s
             }
     }
     }
+    """ % (
+        field,
+        eventFields,
+    )
+
+
+def fetch_indexed_block(endpoint=None):
+    """
+    The latest block the subgraph has indexed, events after it are not served yet
+    """
+    if endpoint is None:
+        endpoint = get_endpoint()
+    result = endpoint("query { _meta { block { number } } }", {})
+    if result.get("errors"):
+        raise ValueError("Subgraph query failed: {}".format(result["errors"]))
+    return int(result["data"]["_meta"]["block"]["number"])
+
+
+def fetch_geyser_events_page(endpoint, kind, geyserId, startBlock, endBlock, cursor):
+    """
+    One page of stake or unstake events after the cursor
+    """
+    variables = {
+        "geyserId": geyserId,
+        "startBlock": str(startBlock),
+        "endBlock": str(endBlock),
+        "cursor": cursor,
+        "first": pageSize,
+    }
+    result = endpoint(geyser_events_query(eventQueries[kind]), variables)
+    if result.get("errors"):
+        raise ValueError("Subgraph query failed: {}".format(result["errors"]))
+    return result["data"]["geyser"]
+
+
+def iter_geyser_event_pages(
+    geyserId, startBlock=0, endBlock=maxBlock, cursors=None, endpoint=None
+):
+    """
+    Page through a geyser's events in a block range, yielding (kind, geyser, cursor) for each page
+    geyser holds the page in "events" along with the geyser's current totalStaked
+    Pass the last cursors seen to resume an interrupted fetch
     """
+    if endpoint is None:
+        endpoint = get_endpoint()
+    if cursors is None:
+        cursors = {}
+    geyserId = str(geyserId).lower()
+
+    for kind in eventQueries:
+        cursor = cursors.get(kind, "")
+        while True:
+            geyser = fetch_geyser_events_page(
+                endpoint, kind, geyserId, startBlock, endBlock, cursor
+            )
+            if not geyser:
+                return
+            events = geyser["events"]
+            if events:
+                cursor = events[-1]["id"]
+            yield kind, geyser, cursor
+            if len(events) < pageSize:
+                break
 
-    variables = {"geyserId": geyserId}
-    endpoint = HTTPEndpoint(url, headers)
-    result = endpoint(query)
 
-    unstakes = []
-    stakes = []
+def fetch_all_geyser_events(geyserId, startBlock=0, endBlock=maxBlock, endpoint=None):
+    print("fetch_geyser_events", geyserId)
+
+    events = {kind: [] for kind in eventQueries}
     totalStaked = 0
+    for kind, geyser, cursor in iter_geyser_event_pages(
+        geyserId, startBlock, endBlock, endpoint=endpoint
+    ):
+        events[kind].extend(geyser["events"])
+        totalStaked = geyser["totalStaked"]
 
-    # Find this geyser
-    for entry in result["data"]["geysers"]:
-        if entry["id"] == geyserId:
-            stakes = entry["stakeEvents"]
-            unstakes = entry["unstakeEvents"]
-            totalStaked = entry["totalStaked"]
+    # Pages are in id order
+    for kind in events:
+        events[kind].sort(key=lambda event: int(event["blockNumber"]))
 
-    # console.log(result['data'])
     return {
         "id": geyserId,
-        "unstakes": unstakes,
-        "stakes": stakes,
+        "unstakes": events["unstakes"],
+        "stakes": events["stakes"],
         "totalStaked": totalStaked,
     }
@@ -1,3 +1,5 @@
 subgraph_config = {
     "url": "https://api.thegraph.com/subgraphs/name/m4azey/badger-finance",
+    # Largest page the hosted service returns
+    "pageSize": 1000,
 }
@@ -7,5 +7,54 @@ class RewardsConfig:
         self.maxStartBlockAge = 3200
         self.debug = False
 
+        # Guardian verifies the pending root from checkpoints, recomputing only the proposed range
+        self.fastGuardian = False
+
+        # Where geyser events come from: "rpc", "subgraph" or "file" (a recorded fixture, for offline runs)
+        self.eventSource = "rpc"
+        self.eventFixtureFile = "cache/event_fixture.json"
+
+        # Local event store, re-fetching recent blocks in case of reorgs
+        # Geyser checkpoints are taken this many blocks before the end of a cycle, for the same reason
+        self.eventStoreDir = "cache/events"
+        self.eventStoreConfirmations = 20
+
+        # Adaptive getLogs block window, learned spans are remembered per contract
+        self.blockWindowFile = "cache/block_windows.json"
+        self.blockWindowInitialSpan = 1000
+        self.blockWindowMaxSpan = 500000
+        self.blockWindowTargetResults = 2000
+
+        # getLogs retries on network errors and rate limits, with exponential backoff from the delay (seconds)
+        self.logFetchRetries = 5
+        self.logFetchRetryDelay = 1
+
+        # Geyser state at the end of each cycle, so cycles resume instead of replaying history
+        self.checkpointDir = "cache/checkpoints"
+        self.checkpointsKept = 48
+
+        # Downloaded rewards files, named by their content hash and so immutable
+        self.rewardsCacheDir = "cache/rewards"
+        self.rewardsCacheMaxBytes = 2 * 1024 ** 3
+
+        # Rewards uploads, larger files are sent as parallel multipart uploads
+        self.s3MultipartThreshold = 16 * 1024 ** 2
+        self.s3MultipartChunkSize = 16 * 1024 ** 2
+        self.s3MaxConcurrency = 8
+
+        # Proofs derived from a rewards layers artifact kept in memory
+        # Claims whose derived proofs are compared to the tree's before the artifact is written
+        self.proofCacheSize = 4096
+        self.layersCheckedClaims = 256
+
+        # Finalized block timestamps
+        self.blockCacheFile = "cache/blocks.json"
+
+        # Maximum getLogs requests in flight
+        self.logFetchWorkers = 8
+
+        # Geysers processed in parallel, each in its own process
+        self.geyserWorkers = 6
+
 
 rewards_config = RewardsConfig()
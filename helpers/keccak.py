@@ -0,0 +1,145 @@
+import os
+import threading
+
+from Crypto.Hash import keccak as keccak_hash
+
+# The raw keccak functions are pycryptodome internals, without them every hash goes through keccak256
+try:
+    from Crypto.Hash.keccak import _raw_keccak_lib
+    from Crypto.Util._raw_api import (
+        VoidPointer,
+        c_size_t,
+        c_ubyte,
+        c_uint8_ptr,
+        create_string_buffer,
+        get_raw_buffer,
+    )
+
+    # keccak_init capacity for 256 bit digests, and the keccak (not sha3) padding byte
+    CAPACITY = c_size_t(64)
+    ROUNDS = c_ubyte(24)
+    DIGEST_SIZE = c_size_t(32)
+    PADDING = c_ubyte(0x01)
+except (ImportError, AttributeError, TypeError):
+    _raw_keccak_lib = None
+
+"""
+Raw keccak-256 on bytes, for merkle trees
+
+web3.keccak normalizes its arguments on every call, here bytes go straight to pycryptodome (already a dependency of eth-brownie)
+Layers are hashed in a batch that reuses one keccak state and digest buffer, instead of a new hash object per pair
+"""
+
+# (process, thread) -> KeccakBatch, or None where the raw functions don't work
+batches = {}
+
+
+def keccak256(data):
+    return keccak_hash.new(data=data, digest_bits=256).digest()
+
+
+def hex_to_bytes(value):
+    if value.startswith("0x") or value.startswith("0X"):
+        value = value[2:]
+    if len(value) % 2:
+        value = "0" + value
+    return bytes.fromhex(value)
+
+
+def hash_hexstr(value):
+    """
+    Equivalent of web3.keccak(hexstr=value)
+    """
+    return keccak256(hex_to_bytes(value))
+
+
+class KeccakBatch:
+    """
+    One keccak state and output buffer, reset between hashes
+    Not thread safe, use one per thread or process
+    """
+
+    def __init__(self):
+        state = VoidPointer()
+        result = _raw_keccak_lib.keccak_init(state.address_of(), CAPACITY, ROUNDS)
+        if result:
+            raise ValueError("Error {} while instantiating keccak".format(result))
+        self.state = state.get()
+        self.out = create_string_buffer(32)
+
+    def __del__(self):
+        state = getattr(self, "state", None)
+        if state is not None:
+            _raw_keccak_lib.keccak_destroy(state)
+
+    def hash(self, data):
+        _raw_keccak_lib.keccak_reset(self.state)
+        _raw_keccak_lib.keccak_absorb(
+            self.state, c_uint8_ptr(data), c_size_t(len(data))
+        )
+        _raw_keccak_lib.keccak_digest(self.state, self.out, DIGEST_SIZE, PADDING)
+        return get_raw_buffer(self.out)
+
+
+def new_batch():
+    if _raw_keccak_lib is None:
+        return None
+    try:
+        batch = KeccakBatch()
+        assert batch.hash(b"") == keccak256(b"")
+        return batch
+    except (AttributeError, TypeError, ValueError, AssertionError):
+        return None
+
+
+def raw_batch():
+    """
+    The KeccakBatch of this process and thread, created on first use
+    None if this pycryptodome doesn't expose the raw functions we need
+    """
+    key = (os.getpid(), threading.get_ident())
+    if key not in batches:
+        batches[key] = new_batch()
+    return batches[key]
+
+
+def hash_hexstrs(values):
+    """
+    hash_hexstr for many values, in one batch
+    """
+    batch = raw_batch()
+    hash_value = batch.hash if batch else keccak256
+    return [hash_value(hex_to_bytes(value)) for value in values]
+
+
+def hash_layer(layer, start=0, end=None):
+    """
+    Hash layer[start:end] into the next layer of a sorted pair merkle tree
+    start must be even, a trailing unpaired node is carried up as is
+    """
+    if end is None:
+        end = len(layer)
+    numPairs = (end - start) // 2
+    nextLayer = [None] * ((end - start + 1) // 2)
+
+    batch = raw_batch()
+    hash_pair = batch.hash if batch else keccak256
+
+    for i in range(numPairs):
+        a = layer[start + 2 * i]
+        b = layer[start + 2 * i + 1]
+        nextLayer[i] = hash_pair(a + b if a < b else b + a)
+
+    if (end - start) % 2:
+        nextLayer[-1] = layer[end - 1]
+    return nextLayer
+
+
+def build_layers(leaves):
+    """
+    All layers of a sorted pair merkle tree, from the sorted leaves up to the root
+    """
+    layers = [leaves]
+    while len(layers[-1]) > 1:
+        layers.append(hash_layer(layers[-1]))
+    return layers
@@ -1,42 +1,115 @@
-from itertools import zip_longest
-
-from brownie import web3
+from eth_abi.packed import encode_abi_packed
 from eth_utils import encode_hex
+from helpers.keccak import (
+    build_layers,
+    hash_hexstr,
+    hash_hexstrs,
+    hash_layer,
+    hex_to_bytes,
+    keccak256,
+    raw_batch,
+)
+
+"""
+Sorted pair merkle trees, shared by the rewards tree (BadgerTree) and the hunt airdrop (BadgerHunt / MerkleDistributor)
+
+Both contracts verify with OpenZeppelin MerkleProof: leaves are keccak256 of the encoded node, pairs are hashed in sorted order
+Trees are built, proven and verified in bulk here, so the rewards cycle and the airdrop share the same fast path
+"""
+
+
+def leaf_proof(layers, idx):
+    """
+    Siblings of the leaf at idx in the sorted leaves, one per layer
+    """
+    proof = []
+    for layer in layers:
+        pair_idx = idx ^ 1
+        if pair_idx < len(layer):
+            proof.append(layer[pair_idx])
+        idx >>= 1
+    return proof
+
+
+def verify_proofs(root, leaves, proofs):
+    """
+    Check many (leaf, proof) pairs against one root, as MerkleProof.verify does on chain
+    root and leaves are bytes, proofs are lists of hex strings, returns one bool per leaf
+    """
+    batch = raw_batch()
+    hash_pair = batch.hash if batch else keccak256
+
+    results = []
+    for leaf, proof in zip(leaves, proofs):
+        node = leaf
+        for sibling in proof:
+            sibling = hex_to_bytes(sibling)
+            node = hash_pair(node + sibling if node < sibling else sibling + node)
+        results.append(node == root)
+    return results
+
+
+def verify_proof(root, leaf, proof):
+    return verify_proofs(root, [leaf], [proof])[0]
 
 
 class MerkleTree:
     def __init__(self, elements):
-        self.elements = sorted(set(web3.keccak(hexstr=el) for el in elements))
+        self.elements = sorted(set(hash_hexstrs(elements)))
         self.layers = MerkleTree.get_layers(self.elements)
 
+        # Leaf hash -> position in the sorted leaves
+        self.indexes = {el: i for i, el in enumerate(self.elements)}
+
     @property
     def root(self):
         return self.layers[-1][0]
 
     def get_proof(self, el):
-        el = web3.keccak(hexstr=el)
-        idx = self.elements.index(el)
-        proof = []
-        for layer in self.layers:
-            pair_idx = idx + 1 if idx % 2 == 0 else idx - 1
-            if pair_idx < len(layer):
-                proof.append(encode_hex(layer[pair_idx]))
-            idx //= 2
-        return proof
+        el = hash_hexstr(el)
+        return [encode_hex(node) for node in self.get_leaf_proof(self.indexes[el])]
+
+    def get_leaf_proof(self, idx, layers=None):
+        """
+        Siblings of the leaf at idx in the sorted leaves, one per layer, taken from layers (the tree's own by default)
+        """
+        if layers is None:
+            layers = self.layers
+        return leaf_proof(layers, idx)
+
+    def hex_layers(self):
+        return [[encode_hex(node) for node in layer] for layer in self.layers]
+
+    def get_proofs(self, elements):
+        """
+        Proofs for many elements at once, in the order given
+        Every node is hex encoded once, rather than once per proof it appears in
+        """
+        hexLayers = self.hex_layers()
+        return [
+            leaf_proof(hexLayers, self.indexes[leaf]) for leaf in hash_hexstrs(elements)
+        ]
+
+    def get_all_proofs(self):
+        """
+        Leaf hash -> proof for every leaf
+        """
+        hexLayers = self.hex_layers()
+        return {el: leaf_proof(hexLayers, idx) for idx, el in enumerate(self.elements)}
+
+    def verify_proofs(self, elements, proofs):
+        """
+        One bool per element, True if its proof leads to this tree's root
+        """
+        return verify_proofs(self.root, hash_hexstrs(elements), proofs)
 
     @staticmethod
     def get_layers(elements):
-        layers = [elements]
-        while len(layers[-1]) > 1:
-            layers.append(MerkleTree.get_next_layer(layers[-1]))
-        return layers
+        return build_layers(elements)
 
     @staticmethod
     def get_next_layer(elements):
-        return [
-            MerkleTree.combined_hash(a, b)
-            for a, b in zip_longest(elements[::2], elements[1::2])
-        ]
+        return hash_layer(elements)
 
     @staticmethod
     def combined_hash(a, b):
@@ -44,4 +117,58 @@ class MerkleTree:
             return b
         if b is None:
             return a
-        return web3.keccak(b"".join(sorted([a, b])))
+        return keccak256(a + b if a < b else b + a)
+
+
+def distribution_node(index, account, amount):
+    """
+    MerkleDistributor / BadgerHunt node: abi.encodePacked(index, account, amount)
+    """
+    return encode_hex(
+        encode_abi_packed(["uint256", "address", "uint256"], [index, account, amount])
+    )
+
+
+def build_distribution(balances):
+    """
+    Airdrop claims for account -> amount, in the format of merkle/airdrop.json
+    Accounts are indexed in sorted order
+    """
+    accounts = sorted(balances)
+    nodes = [
+        distribution_node(index, account, balances[account])
+        for index, account in enumerate(accounts)
+    ]
+    tree = MerkleTree(nodes)
+    proofs = tree.get_proofs(nodes)
+
+    return {
+        "merkleRoot": encode_hex(tree.root),
+        "tokenTotal": hex(sum(balances.values())),
+        "claims": {
+            account: {
+                "index": index,
+                "amount": hex(balances[account]),
+                "proof": proofs[index],
+            }
+            for index, account in enumerate(accounts)
+        },
+    }
+
+
+def verify_distribution(distribution):
+    """
+    Accounts whose airdrop claim does not verify against the distribution's merkle root
+    """
+    accounts = list(distribution["claims"])
+    claims = [distribution["claims"][account] for account in accounts]
+    nodes = [
+        distribution_node(claim["index"], account, int(claim["amount"], 16))
+        for account, claim in zip(accounts, claims)
+    ]
+    results = verify_proofs(
+        hex_to_bytes(distribution["merkleRoot"]),
+        hash_hexstrs(nodes),
+        [claim["proof"] for claim in claims],
+    )
+    return [account for account, valid in zip(accounts, results) if not valid]
@@ -0,0 +1,78 @@
+import secrets
+import time
+from itertools import zip_longest
+
+from brownie import web3
+from helpers.keccak import hash_hexstr, hash_layer, keccak256
+from tabulate import tabulate
+
+numLeaves = 100000
+
+
+def legacy_next_layer(elements):
+    """
+    Previous implementation: web3.keccak over a sorted list per pair
+    """
+
+    def combined_hash(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return web3.keccak(b"".join(sorted([a, b])))
+
+    return [combined_hash(a, b) for a, b in zip_longest(elements[::2], elements[1::2])]
+
+
+def build_layers(leaves, next_layer):
+    layers = [leaves]
+    while len(layers[-1]) > 1:
+        layers.append(next_layer(layers[-1]))
+    return layers
+
+
+def per_pair_next_layer(elements):
+    """
+    Raw keccak, but a new hash object per pair
+    """
+    nextLayer = [
+        keccak256(a + b if a < b else b + a)
+        for a, b in zip(elements[::2], elements[1::2])
+    ]
+    if len(elements) % 2:
+        nextLayer.append(elements[-1])
+    return nextLayer
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+
+def main():
+    elements = ["0x" + secrets.token_hex(100) for i in range(numLeaves)]
+
+    (legacyLeaves, legacyLeafTime) = timed(
+        lambda: sorted(set(web3.keccak(hexstr=el) for el in elements))
+    )
+    (leaves, leafTime) = timed(lambda: sorted(set(hash_hexstr(el) for el in elements)))
+    assert leaves == legacyLeaves
+
+    (legacy, legacyTime) = timed(lambda: build_layers(legacyLeaves, legacy_next_layer))
+    (perPair, perPairTime) = timed(lambda: build_layers(leaves, per_pair_next_layer))
+    (batched, batchedTime) = timed(lambda: build_layers(leaves, hash_layer))
+
+    # Every layer must be identical to the web3 path
+    assert perPair == legacy
+    assert batched == legacy
+
+    table = [
+        ["leaves: web3.keccak", legacyLeafTime],
+        ["leaves: raw keccak", leafTime],
+        ["layers: web3.keccak, sorted pairs", legacyTime],
+        ["layers: raw keccak per pair", perPairTime],
+        ["layers: raw keccak batched", batchedTime],
+    ]
+    print("{} leaves".format(numLeaves))
+    print(tabulate(table, headers=["implementation", "seconds"]))
@@ -0,0 +1,83 @@
+import random
+import time
+from fractions import Fraction
+from statistics import mean
+
+from assistant.rewards.BadgerGeyserMock import LinearLogic
+from config.badger_config import badger_config
+from helpers.time_utils import days
+from tabulate import tabulate
+
+numStakes = 100000
+
+
+def reference_integral(x1, x2):
+    """
+    Reference: exact piecewise integral of the multiplier, directly in rationals
+    """
+    y0 = Fraction(badger_config.startMultiplier)
+    y1 = Fraction(badger_config.endMultiplier)
+    duration = days(7 * 8)
+
+    def area(x):
+        if x <= duration:
+            return y0 * x + (y1 - y0) * x * x / (2 * duration)
+        return area(duration) + y1 * (x - duration)
+
+    return area(x2) - area(x1)
+
+
+def legacy_integral(logic, x1, x2):
+    """
+    Previous implementation: float slope, average of the endpoints
+    """
+    y1 = logic.y(x1)
+    y2 = logic.y(x2)
+    return (x2 - x1) * mean([float(y2), float(y1)])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (result, time.perf_counter() - start)
+
+
+def main():
+    logic = LinearLogic(
+        {"x": 0, "y": badger_config.startMultiplier},
+        {"x": days(7 * 8), "y": badger_config.endMultiplier},
+    )
+
+    random.seed(0)
+    ranges = []
+    for i in range(numStakes):
+        x1 = random.randint(0, days(7 * 12))
+        ranges.append((x1, x1 + random.randint(0, days(7))))
+    x1s = [r[0] for r in ranges]
+    x2s = [r[1] for r in ranges]
+
+    (reference, referenceTime) = timed(
+        lambda: [int(reference_integral(x1, x2)) for (x1, x2) in ranges]
+    )
+    (legacy, legacyTime) = timed(
+        lambda: [int(legacy_integral(logic, x1, x2)) for (x1, x2) in ranges]
+    )
+    (single, singleTime) = timed(
+        lambda: [logic.integral_floor(x1, x2) for (x1, x2) in ranges]
+    )
+    (many, manyTime) = timed(lambda: logic.integral_floor_many(x1s, x2s))
+
+    # Integer integrator must be bit-identical to the reference
+    assert single == reference
+    assert many == reference
+
+    legacyMismatches = sum(1 for a, b in zip(legacy, reference) if a != b)
+
+    table = [
+        ["reference (Fraction)", referenceTime, 0],
+        ["legacy (float, mean)", legacyTime, legacyMismatches],
+        ["integral_floor", singleTime, 0],
+        ["integral_floor_many", manyTime, 0],
+    ]
+    print("{} stakes".format(numStakes))
+    print(tabulate(table, headers=["implementation", "seconds", "mismatches"]))
@@ -0,0 +1,260 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+from assistant.rewards.BadgerGeyserMock import BadgerGeyserMock
+from assistant.rewards.block_cache import block_cache
+from assistant.rewards.calc_stakes import (
+    calc_geyser_stakes,
+    events_to_actions,
+    process_actions,
+)
+from assistant.rewards.merkle_tree import rewards_to_merkle_tree
+from assistant.rewards.rewards_assistant import process_cumulative_rewards, sum_rewards
+from config.rewards_config import rewards_config
+from rich.console import Console
+from scripts.benchmark.synthetic import (
+    NullCheckpoints,
+    SyntheticGeyser,
+    block_timestamp,
+    generate_geyser_events,
+)
+from tabulate import tabulate
+
+console = Console()
+
+"""
+Rewards cycle benchmark over synthetic geyser histories, without a chain or network
+
+Each stage is timed, then run again under tracemalloc for its peak memory
+Baselines are wall clock times for one machine and interpreter, so they are kept out of the repo
+Record them on a clean checkout before a change, then check the change against them:
+    brownie run scripts/benchmark/rewards_cycle.py main record
+    brownie run scripts/benchmark/rewards_cycle.py main check
+
+Times are compared relative to a fixed calibration workload, which absorbs some of the drift between runs
+"""
+
+# (users, events, geysers), events are split evenly across geysers
+scenarios = [
+    (1000, 10000, 2),
+    (10000, 100000, 4),
+    (50000, 500000, 6),
+]
+
+# Blocks in the measured rewards cycle, about an hour
+cycleBlocks = 300
+
+baselinesFile = "cache/benchmark_baselines.json"
+
+# Slowdown or memory growth over the baseline reported as a regression
+regressionTolerance = 1.25
+
+
+def calibrate(rounds=5):
+    """
+    Best of several runs of a fixed pure Python workload, in seconds
+    """
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        values = {}
+        for j in range(200000):
+            values[j % 1000] = values.get(j % 1000, 0) + j * j
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def measure(fn):
+    """
+    Seconds for one run, peak traced memory for a second run
+    """
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn()
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, seconds, peak)
+
+
+def run_scenario(numUsers, numEvents, numGeysers):
+    events = {
+        "geyser-{}".format(k): generate_geyser_events(
+            numUsers, numEvents // numGeysers, seed=k
+        )
+        for k in range(numGeysers)
+    }
+    endBlock = max(e[-1]["blockNumber"] for e in events.values())
+    startBlock = endBlock - cycleBlocks
+    startTime = block_timestamp(startBlock)
+    endTime = block_timestamp(endBlock)
+    geysers = {key: SyntheticGeyser(key, endBlock) for key in events}
+
+    # Block timestamps are served from the cache, never the chain
+    block_cache.loaded = True
+    confirmedBlock = endBlock - rewards_config.eventStoreConfirmations
+    block_cache.timestamps.update(
+        {
+            startBlock: startTime,
+            confirmedBlock: block_timestamp(confirmedBlock),
+            endBlock: endTime,
+        }
+    )
+
+    results = {}
+
+    def stage(name, fn):
+        (result, seconds, peak) = measure(fn)
+        results[name] = {"seconds": seconds, "peakMemory": peak}
+        return result
+
+    actions = stage(
+        "events_to_actions",
+        lambda: {key: events_to_actions(e) for key, e in events.items()},
+    )
+
+    def process_all():
+        mocks = {}
+        for key, geyserActions in actions.items():
+            geyserMock = BadgerGeyserMock(key)
+            geyserMock.set_current_period(startTime, endTime)
+            mocks[key] = process_actions(
+                geyserMock, geyserActions, startBlock, endBlock
+            )
+        return mocks
+
+    mocks = stage("process_actions", process_all)
+
+    for key, geyserMock in mocks.items():
+        geyserMock.add_distribution_token(geysers[key].getDistributionTokens()[0])
+        geyserMock.add_unlock_schedule(
+            geysers[key].getDistributionTokens()[0], geysers[key].schedule
+        )
+
+    stage(
+        "calc_user_distributions",
+        lambda: {
+            key: geyserMock.calc_user_distributions(
+                geyserMock.calc_token_distributions_in_range(startTime, endTime)
+            )
+            for key, geyserMock in mocks.items()
+        },
+    )
+
+    rewardsByGeyser = stage(
+        "calc_geyser_stakes",
+        lambda: {
+            key: calc_geyser_stakes(
+                key, geysers[key], startBlock, endBlock, events[key], NullCheckpoints(),
+            )
+            for key in geysers
+        },
+    )
+
+    geyserRewards = stage("sum_rewards", lambda: sum_rewards(rewardsByGeyser, 1, None))
+    cumulativeRewards = process_cumulative_rewards(
+        {"cycle": 0, "tokenTotals": {}, "claims": {}}, geyserRewards
+    )
+
+    stage("to_merkle_format", lambda: cumulativeRewards.to_merkle_format())
+    stage(
+        "rewards_to_merkle_tree",
+        lambda: rewards_to_merkle_tree(
+            cumulativeRewards, startBlock, endBlock, geyserRewards
+        ),
+    )
+    return results
+
+
+def load_baselines():
+    if not os.path.exists(baselinesFile):
+        return {}
+    with open(baselinesFile) as f:
+        return json.load(f)
+
+
+def save_baselines(baselines):
+    os.makedirs(os.path.dirname(baselinesFile), exist_ok=True)
+    with open(baselinesFile, "w") as outfile:
+        json.dump(baselines, outfile, indent=4)
+
+
+def main(mode="check"):
+    """
+    mode "check" compares against the baselines, "record" replaces them with this run
+    """
+    assert mode in ["check", "record"]
+    baselines = load_baselines()
+    calibration = calibrate()
+    baseCalibration = baselines.get("calibration")
+    regressions = []
+    results = {}
+
+    for (numUsers, numEvents, numGeysers) in scenarios:
+        name = "{}-users-{}-events-{}-geysers".format(numUsers, numEvents, numGeysers)
+        console.print("\n[bold]{}[/bold]".format(name))
+        results[name] = run_scenario(numUsers, numEvents, numGeysers)
+        baseline = baselines.get("scenarios", {}).get(name)
+
+        table = []
+        for stageName, result in results[name].items():
+            row = [stageName, result["seconds"], result["peakMemory"] / 2 ** 20]
+            if mode == "check" and baseline and stageName in baseline:
+                timeRatio = (result["seconds"] / calibration) / (
+                    baseline[stageName]["seconds"] / baseCalibration
+                )
+                memoryRatio = (
+                    result["peakMemory"] / baseline[stageName]["peakMemory"]
+                    if baseline[stageName]["peakMemory"]
+                    else 1
+                )
+                row += [timeRatio, memoryRatio]
+                if timeRatio > regressionTolerance or memoryRatio > regressionTolerance:
+                    regressions.append((name, stageName, timeRatio, memoryRatio))
+            table.append(row)
+        print(
+            tabulate(
+                table,
+                headers=[
+                    "stage",
+                    "seconds",
+                    "peak MiB",
+                    "time / base",
+                    "memory / base",
+                ],
+            )
+        )
+
+        if mode == "check" and not baseline:
+            console.print(
+                "[yellow]No baseline for {}, record one with main record[/yellow]".format(
+                    name
+                )
+            )
+
+    if mode == "record":
+        console.print("Recording baselines to {}".format(baselinesFile))
+        save_baselines(
+            {
+                "machine": "{} {}, Python {}".format(
+                    platform.system(), platform.machine(), platform.python_version()
+                ),
+                "calibration": calibration,
+                "scenarios": results,
+            }
+        )
+        return
+
+    for (name, stageName, timeRatio, memoryRatio) in regressions:
+        console.print(
+            "[red]Regression in {} / {}: {:.2f}x time, {:.2f}x memory[/red]".format(
+                name, stageName, timeRatio, memoryRatio
+            )
+        )
+    assert not regressions
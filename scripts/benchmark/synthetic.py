@@ -0,0 +1,114 @@
+import random
+
+from assistant.rewards.calc_stakes import globalStartBlock
+from brownie import *
+
+"""
+Synthetic geyser histories for benchmarks, in the normalized event format of assistant.rewards.event_sources
+"""
+
+startTime = 1607000000
+blockTime = 13
+
+badgerToken = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+
+
+def block_timestamp(blockNumber):
+    return startTime + (blockNumber - globalStartBlock) * blockTime
+
+
+def synthetic_address(label):
+    return web3.toChecksumAddress("0x" + web3.keccak(text=label).hex()[-40:])
+
+
+def generate_geyser_events(numUsers, numEvents, seed=0, unstakeRatio=0.3):
+    """
+    Stake and unstake history for one geyser
+    Unstakes are only made by users with a balance, some in full and some partial, so the LIFO stake stacks are exercised
+    """
+    rng = random.Random(seed)
+    users = [synthetic_address("user-{}".format(i)) for i in range(numUsers)]
+    totals = {}
+
+    # Users with a balance, for constant time random choice
+    staked = []
+    stakedIndexes = {}
+
+    events = []
+    blockNumber = globalStartBlock
+    logIndex = 0
+    for i in range(numEvents):
+        if rng.random() < 0.5:
+            blockNumber += rng.randint(1, 20)
+            logIndex = 0
+
+        if staked and rng.random() < unstakeRatio:
+            user = staked[rng.randrange(len(staked))]
+            if rng.random() < 0.5:
+                amount = totals[user]
+            else:
+                amount = rng.randint(1, totals[user])
+            eventName = "Unstaked"
+            totals[user] -= amount
+            if totals[user] == 0:
+                # Swap remove
+                last = staked.pop()
+                if last != user:
+                    staked[stakedIndexes[user]] = last
+                    stakedIndexes[last] = stakedIndexes[user]
+                del stakedIndexes[user]
+        else:
+            user = users[rng.randrange(numUsers)]
+            amount = rng.randint(1, 10 ** 6) * 10 ** 15
+            eventName = "Staked"
+            if not totals.get(user):
+                stakedIndexes[user] = len(staked)
+                staked.append(user)
+            totals[user] = totals.get(user, 0) + amount
+
+        events.append(
+            {
+                "event": eventName,
+                "user": user,
+                "amount": amount,
+                "total": totals[user],
+                "timestamp": block_timestamp(blockNumber),
+                "blockNumber": blockNumber,
+                "logIndex": logIndex,
+            }
+        )
+        logIndex += 1
+    return events
+
+
+class SyntheticGeyser:
+    """
+    Stands in for a BadgerGeyser contract, with one BADGER unlock schedule over the whole history
+    """
+
+    def __init__(self, key, endBlock, initialLocked=10 ** 24):
+        self.address = synthetic_address("geyser-{}".format(key))
+        self.schedule = (
+            initialLocked,
+            block_timestamp(endBlock),
+            block_timestamp(endBlock) - startTime,
+            startTime,
+        )
+
+    def getDistributionTokens(self):
+        return [badgerToken]
+
+    def getUnlockSchedulesFor(self, token):
+        return [self.schedule]
+
+
+class NullCheckpoints:
+    """
+    Checkpoint store that never resumes, so every run replays the full history
+    """
+
+    def latest(self, geyserAddress, maxBlock):
+        return None
+
+    def save(self, geyserAddress, block, endTime, state):
+        pass
@@ -0,0 +1,98 @@
+import gzip
+import io
+import json
+import os
+
+import pytest
+from assistant.rewards import aws_utils
+from assistant.rewards.aws_utils import gzip_file, iter_decoded_body, open_download
+from assistant.rewards.rewards_assistant import download_rewards_tree
+from assistant.rewards.rewards_cache import RewardsFileCache
+from botocore.exceptions import ClientError
+from config.rewards_config import rewards_config
+
+
+def test_gzip_bodies_decode_in_chunks():
+    content = os.urandom(8192).hex().encode("ascii")
+    body = io.BytesIO(gzip.compress(content))
+
+    chunks = list(iter_decoded_body(body, "gzip", chunkSize=1024))
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == content
+
+
+def test_uncompressed_bodies_pass_through():
+    content = b'{"claims": {}}'
+    assert b"".join(iter_decoded_body(io.BytesIO(content))) == content
+
+
+def test_gzip_file_round_trips(tmp_path):
+    fileName = str(tmp_path / "rewards-1-0x01.json")
+    content = b'{"claims": {}}' * 1000
+    with open(fileName, "wb") as f:
+        f.write(content)
+
+    gzipFileName = gzip_file(fileName)
+
+    with open(gzipFileName, "rb") as f:
+        body = f.read()
+    assert len(body) < len(content)
+    assert b"".join(iter_decoded_body(io.BytesIO(body), "gzip")) == content
+
+
+def test_downloads_stream_through_the_cache(tmp_path, monkeypatch):
+    tree = {"cycle": 1, "claims": {str(i): os.urandom(32).hex() for i in range(100)}}
+    body = gzip.compress(json.dumps(tree).encode("utf-8"))
+    requests = []
+
+    class S3:
+        def get_object(self, Bucket, Key):
+            requests.append(Key)
+            return {"Body": io.BytesIO(body), "ContentEncoding": "gzip"}
+
+    monkeypatch.setattr(aws_utils, "get_s3_client", lambda: S3())
+    monkeypatch.setattr(rewards_config, "rewardsCacheDir", str(tmp_path))
+
+    for i in range(2):
+        with open_download("rewards-1-0x01.json") as f:
+            assert json.load(f) == tree
+    assert requests == ["rewards/rewards-1-0x01.json"]
+
+
+def test_missing_sidecars_are_requested_once(tmp_path, monkeypatch):
+    tree = {"cycle": 1, "claims": {}}
+    requests = []
+
+    class S3:
+        def get_object(self, Bucket, Key):
+            requests.append(Key)
+            if Key.endswith(".layers"):
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            return {"Body": io.BytesIO(json.dumps(tree).encode("utf-8"))}
+
+    monkeypatch.setattr(aws_utils, "get_s3_client", lambda: S3())
+    monkeypatch.setattr(rewards_config, "rewardsCacheDir", str(tmp_path))
+
+    assert download_rewards_tree("rewards-1-0x01.json") == tree
+    assert download_rewards_tree("rewards-1-0x01.json") == tree
+    assert download_rewards_tree("rewards-1-0x02.json") == tree
+    assert requests == [
+        "rewards/rewards-1-0x01.layers",
+        "rewards/rewards-1-0x01.json",
+        "rewards/rewards-1-0x02.layers",
+        "rewards/rewards-1-0x02.json",
+    ]
+
+
+def test_access_errors_are_not_remembered_as_missing(tmp_path, monkeypatch):
+    class S3:
+        def get_object(self, Bucket, Key):
+            raise ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+
+    monkeypatch.setattr(aws_utils, "get_s3_client", lambda: S3())
+    monkeypatch.setattr(rewards_config, "rewardsCacheDir", str(tmp_path))
+
+    with pytest.raises(ClientError):
+        download_rewards_tree("rewards-1-0x01.json")
+    assert not RewardsFileCache().is_missing("rewards-1-0x01.layers")
@@ -0,0 +1,65 @@
+import pytest
+from assistant.rewards.event_sources import (
+    FileEventSource,
+    GeyserEventSource,
+    get_event_source,
+    parse_subgraph_event,
+    write_event_fixture,
+)
+
+geyser = "0x0000000000000000000000000000000000000001"
+user = "0xabcdef00000000000000000000000000000000Aa"
+
+
+def make_event(name, blockNumber, logIndex=0):
+    return {
+        "event": name,
+        "user": user,
+        "amount": 10,
+        "total": 10,
+        "timestamp": 1000 + blockNumber,
+        "blockNumber": blockNumber,
+        "logIndex": logIndex,
+    }
+
+
+def test_file_source_replays_recorded_events_in_range(tmp_path):
+    fileName = str(tmp_path / "events.json")
+    recorded = {geyser: [make_event("Staked", b) for b in range(100, 110)]}
+    write_event_fixture(fileName, recorded)
+
+    source = FileEventSource(fileName)
+    events = source.fetch([geyser, "0x02"], 102, 104)
+
+    assert not source.persistent
+    assert [e["blockNumber"] for e in events[geyser]] == [102, 103, 104]
+    assert events["0x02"] == []
+    assert events[geyser][0] == make_event("Staked", 102)
+
+
+def test_subgraph_events_are_normalized():
+    event = parse_subgraph_event(
+        "Unstaked",
+        {
+            "id": "0xabc-7",
+            "user": user.lower(),
+            "amount": "10",
+            "total": "10",
+            "timestamp": "1105",
+            "blockNumber": "105",
+            "data": "0x",
+        },
+    )
+    assert event == make_event("Unstaked", 105, 7)
+
+
+def test_sources_are_selected_by_name():
+    assert get_event_source("rpc").name == "rpc"
+    assert get_event_source("subgraph").name == "subgraph"
+    assert isinstance(get_event_source("file"), FileEventSource)
+
+
+def test_sources_must_implement_fetch():
+    with pytest.raises(TypeError):
+        GeyserEventSource()
+    assert get_event_source("rpc").indexed_block() is None
@@ -0,0 +1,88 @@
+from assistant.rewards.event_store import GeyserEventStore
+
+geyser = "0xa9429271a28F8543eFFfa136994c0839E7d7bF77"
+
+
+def make_event(blockNumber, user="0x0000000000000000000000000000000000000001"):
+    return {
+        "event": "Staked",
+        "user": user,
+        "amount": 100,
+        "total": 100,
+        "timestamp": blockNumber * 13,
+        "blockNumber": blockNumber,
+        "logIndex": 0,
+    }
+
+
+def test_incremental_fetch(tmp_path):
+    requested = []
+
+    def fetch(fromBlock, toBlock):
+        requested.append((fromBlock, toBlock))
+        return [make_event(b) for b in range(fromBlock, toBlock + 1) if b % 10 == 0]
+
+    store = GeyserEventStore(directory=str(tmp_path), confirmations=5)
+
+    events = store.get_events(geyser, 100, 200, fetch)
+    assert len(events) == 11
+    assert requested == [(100, 200)]
+
+    # Only blocks within the confirmation depth and after the stored height are fetched again
+    events = store.get_events(geyser, 100, 250, fetch)
+    assert len(events) == 16
+    assert requested[-1] == (196, 250)
+
+    # A range entirely within the store doesn't touch the node
+    events = store.get_events(geyser, 120, 150, fetch)
+    assert len(events) == 4
+    assert len(requested) == 2
+
+
+def test_reorg_within_confirmations(tmp_path):
+    store = GeyserEventStore(directory=str(tmp_path), confirmations=5)
+    store.get_events(geyser, 100, 200, lambda a, b: [make_event(150), make_event(199)])
+
+    # Event at 199 was reorged out
+    events = store.get_events(geyser, 100, 210, lambda a, b: [make_event(205)])
+    assert [e["blockNumber"] for e in events] == [150, 205]
+
+
+def test_single_fetch_for_all_geysers(tmp_path):
+    other = "0xd6F9b47A1e8E5b2B1c0e5b1d0e2b4B5c3C6E9f0a"
+    requested = []
+
+    def fetch(addresses, fromBlock, toBlock):
+        requested.append((list(addresses), fromBlock, toBlock))
+        return {a: [make_event(fromBlock), make_event(toBlock)] for a in addresses}
+
+    store = GeyserEventStore(directory=str(tmp_path), confirmations=5)
+    store.get_events(geyser, 100, 200, lambda a, b: [make_event(a), make_event(b)])
+
+    # Geysers with different stored heights are fetched together from the lowest height needed
+    events = store.get_events_for_all([geyser, other], 100, 300, fetch)
+    assert requested == [([geyser, other], 100, 300)]
+    assert [e["blockNumber"] for e in events[geyser]] == [100, 300]
+    assert [e["blockNumber"] for e in events[other]] == [100, 300]
+
+
+def test_lagging_source_coverage_is_capped(tmp_path):
+    requested = []
+
+    def fetch(addresses, fromBlock, toBlock):
+        requested.append((fromBlock, toBlock))
+        return {a: [make_event(fromBlock)] for a in addresses}
+
+    # The source has only indexed up to 180, blocks after it are fetched again next time
+    store = GeyserEventStore(
+        directory=str(tmp_path), confirmations=5, source="subgraph"
+    )
+    store.get_events_for_all([geyser], 100, 200, fetch, indexedBlock=180)
+    assert store.load(geyser)["endBlock"] == 180
+
+    store.get_events_for_all([geyser], 100, 200, fetch, indexedBlock=200)
+    assert requested == [(100, 200), (176, 200)]
+
+    # Each source has its own store
+    other = GeyserEventStore(directory=str(tmp_path), confirmations=5, source="rpc")
+    assert other.load(geyser) is None
@@ -0,0 +1,205 @@
+import pickle
+
+import pytest
+from assistant.rewards import calc_stakes
+from assistant.rewards.BadgerGeyserMock import BadgerGeyserMock
+from assistant.rewards.calc_stakes import (
+    DeferredCheckpoints,
+    GeyserSnapshot,
+    calc_geyser_stakes,
+    collect_geyser_events,
+    globalStartBlock,
+)
+from assistant.rewards.event_sources import GeyserEventSource
+from assistant.rewards.event_store import GeyserEventStore
+from assistant.rewards.geyser_checkpoints import GeyserCheckpointStore
+from dotmap import DotMap
+from helpers.time_utils import days, hours
+
+geyser = "0xa9429271a28F8543eFFfa136994c0839E7d7bF77"
+user = "0x0000000000000000000000000000000000000001"
+start = 1607014800
+
+
+def stake(mock, timestamp, amount, total):
+    mock.stake(
+        user,
+        DotMap(
+            user=user,
+            action="Stake",
+            amount=amount,
+            userTotal=total,
+            stakedAt=timestamp,
+            timestamp=timestamp,
+        ),
+    )
+
+
+def unstake(mock, timestamp, amount, total):
+    mock.unstake(
+        user,
+        DotMap(
+            user=user,
+            action="Unstake",
+            amount=amount,
+            userTotal=total,
+            timestamp=timestamp,
+        ),
+    )
+
+
+def test_resume_from_checkpoint(tmp_path):
+    store = GeyserCheckpointStore(directory=str(tmp_path), keep=2)
+    periodStart = start + days(10)
+    periodEnd = periodStart + hours(1)
+
+    # Full replay
+    full = BadgerGeyserMock("test")
+    full.set_current_period(periodStart, periodEnd)
+    stake(full, start + days(1), 1000, 1000)
+    stake(full, start + days(2), 500, 1500)
+    unstake(full, start + days(3), 700, 800)
+    stake(full, periodStart + 60, 200, 1000)
+    full.calc_end_share_seconds_for(user)
+
+    # Previous cycle, ending before the current period
+    previous = BadgerGeyserMock("test")
+    previous.set_current_period(start + days(9), periodStart - 1)
+    stake(previous, start + days(1), 1000, 1000)
+    stake(previous, start + days(2), 500, 1500)
+    unstake(previous, start + days(3), 700, 800)
+    previous.calc_end_share_seconds_for(user)
+    store.save(geyser, 100, periodStart - 1, previous.get_checkpoint_state())
+
+    # Resume and apply only the new action
+    resumed = BadgerGeyserMock("test")
+    resumed.set_current_period(periodStart, periodEnd)
+    resumed.load_checkpoint_state(store.latest(geyser, 100))
+    stake(resumed, periodStart + 60, 200, 1000)
+    resumed.calc_end_share_seconds_for(user)
+
+    assert resumed.users[user].stakeAmounts == full.users[user].stakeAmounts
+    assert resumed.users[user].stakedAts == full.users[user].stakedAts
+    assert resumed.users[user].total == full.users[user].total
+    assert (
+        resumed.users[user].shareSecondsInRange == full.users[user].shareSecondsInRange
+    )
+
+    # Splitting the integral at the checkpoint only changes rounding
+    assert abs(resumed.users[user].shareSeconds - full.users[user].shareSeconds) < 2000
+
+
+def test_latest_checkpoint(tmp_path):
+    store = GeyserCheckpointStore(directory=str(tmp_path), keep=2)
+    for block in [100, 200, 300]:
+        store.save(geyser, block, block, {"totalShareSeconds": 0, "users": {}})
+
+    assert store.blocks_for(geyser) == [200, 300]
+    assert store.latest(geyser, 299)["block"] == 200
+    assert store.latest(geyser, 150) is None
+
+
+def test_worker_inputs_and_checkpoints(tmp_path):
+    store = GeyserCheckpointStore(directory=str(tmp_path), keep=2)
+    store.save(geyser, 100, 100, {"totalShareSeconds": 0, "users": {}})
+
+    # Saves from a worker are deferred, reads go to the store
+    deferred = DeferredCheckpoints(store)
+    deferred.save(geyser, 200, 200, {"totalShareSeconds": 0, "users": {}})
+    assert deferred.latest(geyser, 300)["block"] == 100
+    assert store.blocks_for(geyser) == [100]
+    assert pickle.loads(pickle.dumps(deferred.saved)) == deferred.saved
+
+    class Geyser:
+        address = geyser
+
+        def getDistributionTokens(self):
+            return ["0x3472A5A71965499acd81997a54BBA8D852C6E53d"]
+
+        def getUnlockSchedulesFor(self, token):
+            return [[10 ** 24, start + days(7), days(7), start]]
+
+    snapshot = pickle.loads(pickle.dumps(GeyserSnapshot.read(Geyser())))
+    assert snapshot.address == geyser
+    assert snapshot.getDistributionTokens() == Geyser().getDistributionTokens()
+    assert snapshot.getUnlockSchedulesFor(snapshot.getDistributionTokens()[0]) == [
+        (10 ** 24, start + days(7), days(7), start)
+    ]
+
+
+def test_checkpoints_skip_unconfirmed_blocks(tmp_path, monkeypatch):
+    other = "0x0000000000000000000000000000000000000002"
+    monkeypatch.setattr(calc_stakes.rewards_config, "eventStoreConfirmations", 20)
+    monkeypatch.setattr(
+        calc_stakes,
+        "get_block_timestamps",
+        lambda blocks: {b: start + (b - globalStartBlock) * 13 for b in blocks},
+    )
+
+    class Geyser:
+        address = geyser
+
+        def getDistributionTokens(self):
+            return ["0x3472A5A71965499acd81997a54BBA8D852C6E53d"]
+
+        def getUnlockSchedulesFor(self, token):
+            return [[10 ** 24, start + days(7), days(7), start]]
+
+    def event(user, block, amount):
+        return {
+            "event": "Staked",
+            "user": user,
+            "amount": amount,
+            "total": amount,
+            "timestamp": start + (block - globalStartBlock) * 13,
+            "blockNumber": block,
+            "logIndex": 0,
+        }
+
+    # The stake of the other user in block 190 is later reorged into block 195
+    before = [event(user, globalStartBlock + 100, 1000)]
+    seen = before + [event(other, globalStartBlock + 190, 500)]
+    final = before + [event(other, globalStartBlock + 195, 500)]
+
+    store = GeyserCheckpointStore(directory=str(tmp_path / "resumed"), keep=2)
+    calc_geyser_stakes(
+        "test", Geyser(), globalStartBlock + 150, globalStartBlock + 200, seen, store
+    )
+    checkpoint = store.latest(geyser, globalStartBlock + 200)
+    assert checkpoint["block"] == globalStartBlock + 180
+    assert list(checkpoint["users"]) == [user]
+
+    full = GeyserCheckpointStore(directory=str(tmp_path / "full"), keep=2)
+    for checkpoints in [store, full]:
+        calc_geyser_stakes(
+            "test",
+            Geyser(),
+            globalStartBlock + 201,
+            globalStartBlock + 300,
+            final,
+            checkpoints,
+        )
+    resumed = store.latest(geyser, globalStartBlock + 300)
+    replayed = full.latest(geyser, globalStartBlock + 300)
+    assert resumed["block"] == replayed["block"] == globalStartBlock + 280
+    assert resumed["users"][other]["stakes"] == replayed["users"][other]["stakes"]
+
+
+def test_lagging_event_source_is_an_error(tmp_path):
+    class LaggingSource(GeyserEventSource):
+        name = "subgraph"
+
+        def indexed_block(self):
+            return 180
+
+        def fetch(self, geyserAddresses, startBlock, endBlock):
+            return {address: [] for address in geyserAddresses}
+
+    store = GeyserEventStore(directory=str(tmp_path), source="subgraph")
+    geysers = {"geyser": DotMap(address=geyser)}
+
+    assert collect_geyser_events(geysers, 100, 180, store, LaggingSource()) == {
+        "geyser": []
+    }
+    with pytest.raises(ValueError):
+        collect_geyser_events(geysers, 100, 200, store, LaggingSource())
@@ -0,0 +1,74 @@
+from fractions import Fraction
+
+import pytest
+from assistant.rewards import BadgerGeyserMock as geyser_mock
+from assistant.rewards.BadgerGeyserMock import BadgerGeyserMock, GeyserUser, LinearLogic
+from helpers.time_utils import days
+
+duration = days(7 * 8)
+
+
+def make_logic():
+    return LinearLogic({"x": 0, "y": 1}, {"x": duration, "y": 3})
+
+
+def test_integral_before_cap():
+    logic = make_logic()
+    assert logic.integral(0, duration) == 2 * duration
+    assert logic.integral(0, 100) == Fraction(100) + Fraction(100 * 100, duration)
+    assert logic.integral_floor(0, 100) == 100
+
+
+def test_integral_across_cap():
+    logic = make_logic()
+    # The multiplier is flat after the cap
+    assert logic.integral(duration, duration + 100) == 300
+    assert logic.integral(0, duration + 100) == 2 * duration + 300
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_integral_floor_many(monkeypatch, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(geyser_mock, "numpy", None)
+    logic = make_logic()
+    x1s = [0, 10, duration - 5, duration * 2, 0]
+    x2s = [days(1), duration + 10, duration + 5, duration * 2 + 7, 2 ** 70]
+    assert logic.integral_floor_many(x1s, x2s) == [
+        int(logic.integral(x1, x2)) for x1, x2 in zip(x1s, x2s)
+    ]
+
+
+def test_aggregate_share_seconds_match_per_stake_rounding():
+    mock = BadgerGeyserMock("test")
+    data = GeyserUser(0, "0x0000000000000000000000000000000000000001")
+    start = 1607014800
+    for i in range(20):
+        stakedAt = start + days(i * 5)
+        amount = 10 ** 18 + i
+        data.stakeAmounts.append(amount)
+        data.stakedAts.append(stakedAt)
+    stakes = list(zip(data.stakeAmounts, data.stakedAts))
+    mock.rebuild_stake_aggregates(data, start + days(95))
+
+    # Stakes past the end of the ramp are folded into the matured bucket
+    assert len(data.stakeAmounts) == 12
+    assert data.maturedAmount == sum(amount for amount, _ in stakes[:8])
+
+    # Ranges where no stake, some stakes and all stakes reach the end of the ramp
+    for (lastUpdate, timestamp) in [
+        (start + days(95), start + days(96)),
+        (start + days(95), start + days(130)),
+        (start + days(95), start + days(200)),
+    ]:
+        # Each stake's weighted seconds are rounded down on their own, as before the aggregates
+        perStake = sum(
+            amount
+            * mock.logic.integral_floor(lastUpdate - stakedAt, timestamp - stakedAt)
+            for amount, stakedAt in stakes
+        )
+        assert (
+            mock.calculate_aggregate_share_seconds(data, lastUpdate, timestamp)
+            == perStake
+        )
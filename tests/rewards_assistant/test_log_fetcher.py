@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+from assistant.rewards import log_fetcher
+from assistant.rewards.log_fetcher import (
+    AdaptiveBlockWindow,
+    WorkCursor,
+    get_logs_in_range,
+    get_logs_parallel,
+    is_transient_error,
+    is_window_error,
+)
+from config.rewards_config import rewards_config
+from requests.exceptions import Timeout
+
+
+def test_window_grows_and_shrinks():
+    window = AdaptiveBlockWindow(path=None)
+    key = "0xa9429271a28F8543eFFfa136994c0839E7d7bF77"
+    start = window.span(key)
+
+    window.record(key, start, 0)
+    assert window.span(key) == start * 2
+
+    # Partial windows at the end of a scan don't grow the span
+    window.record(key, 10, 0)
+    assert window.span(key) == start * 2
+
+    # Dense windows don't grow the span
+    window.record(key, window.span(key), window.targetResults)
+    assert window.span(key) == start * 2
+
+    window.shrink(key)
+    window.shrink(key)
+    assert window.span(key) == start // 2
+
+    # Spans are tracked per contract
+    assert window.span("other") == start
+
+
+def test_window_errors():
+    assert is_window_error(
+        ValueError(
+            {"code": -32005, "message": "query returned more than 10000 results"}
+        )
+    )
+    assert not is_window_error(ValueError("execution reverted"))
+
+    # Rate limits and network errors are retried, the window is left alone
+    rateLimited = ValueError(
+        {
+            "code": -32005,
+            "message": "daily request count exceeded, request rate limited",
+        }
+    )
+    assert not is_window_error(rateLimited)
+    assert is_transient_error(rateLimited)
+    assert is_transient_error(Timeout())
+    assert not is_window_error(Timeout())
+
+
+def test_transient_errors_keep_the_window(monkeypatch):
+    errors = [Timeout(), ValueError("429 Client Error: Too Many Requests")]
+
+    def getLogs(params):
+        if errors:
+            raise errors.pop()
+        return []
+
+    monkeypatch.setattr(
+        log_fetcher, "web3", SimpleNamespace(eth=SimpleNamespace(getLogs=getLogs))
+    )
+    monkeypatch.setattr(rewards_config, "logFetchRetryDelay", 0)
+
+    window = AdaptiveBlockWindow(path=None)
+    span = window.span("key")
+    assert get_logs_in_range("key", {}, 0, span - 1, window, showProgress=False) == []
+    assert not errors
+    assert window.span("key") == span * 2
+
+
+def drain(cursor):
+    units = []
+    unit = cursor.next_unit()
+    while unit:
+        units.append(unit)
+        unit = cursor.next_unit()
+    return units
+
+
+def test_work_cursor():
+    window = AdaptiveBlockWindow(path=None)
+
+    # Ranges are split so that every worker has work, without exceeding the learned span
+    window.spans["key"] = 1000
+    units = drain(WorkCursor("key", 100, 199, window, 4))
+    assert units == [(100, 124), (125, 149), (150, 174), (175, 199)]
+
+    window.spans["key"] = 10
+    units = drain(WorkCursor("key", 100, 199, window, 4))
+    assert len(units) == 10
+    assert units[-1][1] == 199
+
+    # Units taken after the span has grown use the new span
+    cursor = WorkCursor("key", 0, 99999, window, 1)
+    assert cursor.next_unit() == (0, 9)
+    window.spans["key"] = 40
+    assert cursor.next_unit() == (10, 49)
+
+
+def test_parallel_fetch_grows_the_span(monkeypatch):
+    calls = []
+
+    def getLogs(params):
+        calls.append((params["fromBlock"], params["toBlock"]))
+        return [
+            {"blockNumber": b, "logIndex": 0}
+            for b in range(params["fromBlock"], params["toBlock"] + 1, 100)
+        ]
+
+    monkeypatch.setattr(
+        log_fetcher, "web3", SimpleNamespace(eth=SimpleNamespace(getLogs=getLogs))
+    )
+
+    window = AdaptiveBlockWindow(path=None)
+    logs = get_logs_parallel("key", {}, 0, 999999, window, workers=4)
+    assert [log["blockNumber"] for log in logs] == list(range(0, 1000000, 100))
+
+    # Far fewer calls than fixed units of the initial span
+    assert len(calls) < 1000000 // window.initialSpan // 10
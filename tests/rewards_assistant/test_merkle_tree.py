@@ -0,0 +1,103 @@
+import secrets
+
+import helpers.keccak
+import pytest
+from brownie import web3
+from eth_utils import encode_hex
+from helpers.keccak import hash_hexstr, hash_layer, raw_batch
+from helpers.merkle import (
+    MerkleTree,
+    build_distribution,
+    distribution_node,
+    verify_distribution,
+    verify_proof,
+)
+
+
+def verify(root, leaf, proof):
+    node = leaf
+    for sibling in proof:
+        node = web3.keccak(b"".join(sorted([node, bytes.fromhex(sibling[2:])])))
+    return node == root
+
+
+@pytest.mark.parametrize("numElements", [1, 2, 5, 64, 333])
+def test_bulk_proofs_match_single_proofs(numElements):
+    elements = ["0x" + secrets.token_hex(40) for i in range(numElements)]
+    tree = MerkleTree(elements)
+
+    proofs = tree.get_proofs(elements)
+    allProofs = tree.get_all_proofs()
+
+    for element, proof in zip(elements, proofs):
+        leaf = web3.keccak(hexstr=element)
+        assert proof == tree.get_proof(element) == allProofs[leaf]
+        assert verify(tree.root, leaf, proof)
+
+
+@pytest.mark.parametrize("numNodes", [1, 2, 7, 64])
+def test_hash_layer_matches_web3(numNodes):
+    layer = sorted(web3.keccak(secrets.token_bytes(32)) for i in range(numNodes))
+    expected = [
+        web3.keccak(b"".join(sorted(layer[i : i + 2])))
+        if i + 1 < len(layer)
+        else layer[i]
+        for i in range(0, len(layer), 2)
+    ]
+    assert hash_layer(layer) == expected
+    assert hash_hexstr(encode_hex(layer[0])) == web3.keccak(hexstr=encode_hex(layer[0]))
+
+
+def test_raw_batch_is_reused():
+    assert raw_batch() is raw_batch()
+
+
+def test_hash_layer_without_raw_keccak(monkeypatch):
+    layer = sorted(web3.keccak(secrets.token_bytes(32)) for i in range(5))
+    expected = hash_layer(layer)
+    monkeypatch.setattr(helpers.keccak, "_raw_keccak_lib", None)
+    monkeypatch.setattr(helpers.keccak, "batches", {})
+    assert raw_batch() is None
+    assert hash_layer(layer) == expected
+
+
+@pytest.mark.parametrize("numElements", [1, 2, 5, 64])
+def test_bulk_verify(numElements):
+    elements = ["0x" + secrets.token_hex(40) for i in range(numElements)]
+    tree = MerkleTree(elements)
+    proofs = tree.get_proofs(elements)
+    assert all(tree.verify_proofs(elements, proofs))
+
+    # A proof only verifies its own leaf
+    others = ["0x" + secrets.token_hex(40) for i in range(numElements)]
+    assert not any(tree.verify_proofs(others, proofs))
+    if numElements > 1:
+        tampered = [proofs[0][:-1] + [encode_hex(secrets.token_bytes(32))]]
+        assert tree.verify_proofs(elements[:1], tampered) == [False]
+
+
+def test_distribution_claims_verify():
+    balances = {
+        web3.toChecksumAddress("0x" + secrets.token_hex(20)): i * 10 ** 18
+        for i in range(1, 40)
+    }
+    distribution = build_distribution(balances)
+    assert int(distribution["tokenTotal"], 16) == sum(balances.values())
+    assert verify_distribution(distribution) == []
+
+    # Leaves are keccak256(abi.encodePacked(index, account, amount)), as BadgerHunt checks them
+    root = bytes.fromhex(distribution["merkleRoot"][2:])
+    for account, claim in distribution["claims"].items():
+        packed = (
+            claim["index"].to_bytes(32, "big")
+            + bytes.fromhex(account[2:])
+            + balances[account].to_bytes(32, "big")
+        )
+        assert distribution_node(claim["index"], account, balances[account]) == (
+            encode_hex(packed)
+        )
+        assert verify_proof(root, web3.keccak(packed), claim["proof"])
+
+    account = next(iter(balances))
+    distribution["claims"][account]["amount"] = hex(balances[account] + 1)
+    assert verify_distribution(distribution) == [account]
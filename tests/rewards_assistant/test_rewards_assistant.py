@@ -0,0 +1,87 @@
+import io
+import json
+from contextlib import contextmanager
+
+from assistant.rewards import rewards_assistant
+from assistant.rewards.merkle_tree import rewards_to_merkle_tree
+from assistant.rewards.rewards_assistant import (
+    process_cumulative_rewards,
+    verify_pending_rewards,
+)
+from assistant.rewards.RewardsList import RewardsList
+
+badger = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+users = [
+    "0x0000000000000000000000000000000000000001",
+    "0x0000000000000000000000000000000000000002",
+]
+
+
+def propose(monkeypatch, proposedStartBlock, proposedEndBlock):
+    """
+    A current tree up to block 199 and a pending tree over the proposed range
+    Returns the ranges rewards are recomputed and compared over
+    """
+    current = RewardsList(1, None)
+    current.increase_user_rewards(users[0], badger, 10)
+    currentTree = rewards_to_merkle_tree(current, 100, 199, current)
+
+    geyserRewards = RewardsList(2, None)
+    geyserRewards.increase_user_rewards(users[1], badger, 5)
+    proposedTree = rewards_to_merkle_tree(
+        process_cumulative_rewards(currentTree, geyserRewards),
+        proposedStartBlock,
+        proposedEndBlock,
+        geyserRewards,
+    )
+
+    @contextmanager
+    def open_download(fileName):
+        yield io.StringIO(json.dumps(proposedTree))
+
+    ranges = {"calc": [], "compare": []}
+
+    def calc_geyser_rewards(badger, startBlock, endBlock, cycle):
+        ranges["calc"].append((startBlock, endBlock))
+        return geyserRewards
+
+    def compare_rewards(badger, startBlock, endBlock, before, after, beforeHash):
+        ranges["compare"].append((startBlock, endBlock))
+
+    monkeypatch.setattr(
+        rewards_assistant,
+        "fetchPendingMerkleData",
+        lambda badger: {"root": proposedTree["merkleRoot"], "contentHash": "0x02"},
+    )
+    monkeypatch.setattr(
+        rewards_assistant,
+        "fetchCurrentMerkleData",
+        lambda badger: {"root": currentTree["merkleRoot"], "contentHash": "0x01"},
+    )
+    monkeypatch.setattr(
+        rewards_assistant, "fetch_current_rewards_tree", lambda badger: currentTree
+    )
+    monkeypatch.setattr(rewards_assistant, "getNextCycle", lambda badger: 2)
+    monkeypatch.setattr(rewards_assistant, "open_download", open_download)
+    monkeypatch.setattr(rewards_assistant, "calc_geyser_rewards", calc_geyser_rewards)
+    monkeypatch.setattr(rewards_assistant, "compare_rewards", compare_rewards)
+    return ranges
+
+
+def test_proposal_behind_the_chain_head_is_verified(monkeypatch):
+    ranges = propose(monkeypatch, 200, 280)
+
+    # The guardian runs with the chain head at 300
+    verification = verify_pending_rewards(None, 200, 300)
+
+    assert verification["verified"]
+    assert verification["rootHash"] == "0x02"
+    assert ranges == {"calc": [(200, 280)], "compare": [(200, 280)]}
+
+
+def test_proposal_not_following_the_last_claim_is_rejected(monkeypatch):
+    # Starting before the block after the last claim, or ending after the chain head
+    for (proposedStartBlock, proposedEndBlock) in [(190, 280), (200, 310)]:
+        ranges = propose(monkeypatch, proposedStartBlock, proposedEndBlock)
+        assert not verify_pending_rewards(None, 200, 300)["verified"]
+        assert ranges == {"calc": [], "compare": []}
@@ -0,0 +1,63 @@
+from assistant.rewards.rewards_binary import (
+    decode_rewards_tree,
+    encode_rewards_tree,
+    save_rewards_tree_binary,
+)
+from assistant.rewards.rewards_file import load_rewards_tree_file, write_rewards_tree
+
+badger = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+users = [
+    "0xD6F9b47A1e8E5b2B1c0e5b1d0e2b4B5c3C6E9f0a",
+    "0x0000000000000000000000000000000000000001",
+    "0xa9429271a28F8543eFFfa136994c0839E7d7bF77",
+]
+
+
+def make_tree():
+    claims = {}
+    for i, user in enumerate(users):
+        claims[user] = {
+            "index": hex(i),
+            "user": user,
+            "cycle": hex(4),
+            "tokens": [badger],
+            "cumulativeAmounts": [str(10 ** 24 + i)],
+            "proof": ["0x" + "{:02x}".format(i) * 32, "0x" + "ff" * 32],
+            "node": "0x" + "{:02x}".format(i) * 96,
+        }
+    return {
+        "merkleRoot": "0x" + "ab" * 32,
+        "cycle": 4,
+        "startBlock": "11500000",
+        "endBlock": "11500300",
+        "tokenTotals": {badger: 3 * 10 ** 24 + 3},
+        "claims": claims,
+        "metadata": {users[0]: {"shareSeconds": 10, "shareSecondsInRange": 5}},
+    }
+
+
+def test_round_trip():
+    tree = make_tree()
+    decoded = decode_rewards_tree(encode_rewards_tree(tree))
+    assert decoded == tree
+
+    # Claims keep their index order
+    assert list(decoded["claims"].keys()) == users
+
+    # Proofs can be skipped
+    light = decode_rewards_tree(encode_rewards_tree(tree), proofs=False)
+    assert "proof" not in light["claims"][users[0]]
+    assert light["claims"][users[0]]["cumulativeAmounts"] == [str(10 ** 24)]
+
+
+def test_load_prefers_sidecar(tmp_path):
+    tree = make_tree()
+    fileName = str(tmp_path / "rewards-1-0x01.json")
+    write_rewards_tree(tree, fileName)
+    assert load_rewards_tree_file(fileName) == tree
+
+    assert save_rewards_tree_binary(tree, str(tmp_path / "rewards-1-0x01.bin"))
+    assert load_rewards_tree_file(fileName) == tree
+    assert load_rewards_tree_file(fileName, proofs=False) == decode_rewards_tree(
+        encode_rewards_tree(tree), proofs=False
+    )
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+
+from assistant.rewards.rewards_cache import RewardsFileCache
+
+
+class LocalS3:
+    """
+    Stand-in for the rewards bucket, counting reads
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.reads = 0
+
+    def download(self, fileName):
+        """
+        Content in chunks, as from a streamed S3 body
+        """
+        self.reads += 1
+        content = self.files[fileName]
+        return (content[i : i + 5] for i in range(0, len(content), 5))
+
+
+def fetch(cache, fileName, s3):
+    with cache.open(fileName, s3.download) as f:
+        return f.read()
+
+
+def test_repeat_downloads_are_cached(tmp_path):
+    s3 = LocalS3({"rewards-1-0x01.json": b'{"cycle": 1}'})
+    cache = RewardsFileCache(directory=str(tmp_path), maxBytes=1024)
+
+    assert fetch(cache, "rewards-1-0x01.json", s3) == b'{"cycle": 1}'
+    assert fetch(cache, "rewards-1-0x01.json", s3) == b'{"cycle": 1}'
+    assert s3.reads == 1
+
+    # A new cache instance over the same directory also hits
+    other = RewardsFileCache(directory=str(tmp_path), maxBytes=1024)
+    assert fetch(other, "rewards-1-0x01.json", s3) == b'{"cycle": 1}'
+    assert s3.reads == 1
+
+
+def test_corrupt_entries_are_refetched(tmp_path):
+    s3 = LocalS3({"rewards-1-0x01.json": b'{"cycle": 1}'})
+    cache = RewardsFileCache(directory=str(tmp_path), maxBytes=1024)
+    fetch(cache, "rewards-1-0x01.json", s3)
+
+    entry = cache.load_index()["rewards-1-0x01.json"]
+    with open(cache.blob_path(entry["sha256"]), "wb") as f:
+        f.write(b'{"cycle": 2}')
+
+    assert fetch(cache, "rewards-1-0x01.json", s3) == b'{"cycle": 1}'
+    assert s3.reads == 2
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    s3 = LocalS3({name: bytes([i]) * 400 for i, name in enumerate(["a", "b", "c"])})
+    cache = RewardsFileCache(directory=str(tmp_path), maxBytes=1000)
+
+    fetch(cache, "a", s3)
+    fetch(cache, "b", s3)
+    fetch(cache, "a", s3)
+    fetch(cache, "c", s3)
+
+    assert set(cache.load_index().keys()) == {"a", "c"}
+    assert cache.get("b") is None
+
+
+def test_reads_do_not_rewrite_the_index(tmp_path):
+    s3 = LocalS3({"rewards-1-0x01.json": b'{"cycle": 1}'})
+    cache = RewardsFileCache(directory=str(tmp_path), maxBytes=1024)
+    fetch(cache, "rewards-1-0x01.json", s3)
+
+    os.utime(cache.index_path(), (0, 0))
+    assert fetch(cache, "rewards-1-0x01.json", s3) == b'{"cycle": 1}'
+    assert os.path.getmtime(cache.index_path()) == 0
+
+
+def put_many(directory, prefix):
+    cache = RewardsFileCache(directory=directory, maxBytes=10 ** 6)
+    for i in range(20):
+        cache.put("{}-{}".format(prefix, i), "{}-{}".format(prefix, i).encode())
+
+
+def test_concurrent_inserts_are_all_indexed(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=put_many, args=(str(tmp_path), p)) for p in "abcd"
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    index = RewardsFileCache(directory=str(tmp_path)).load_index()
+    assert len(index) == 80
@@ -0,0 +1,47 @@
+from assistant.rewards.RewardsList import RewardsList
+from assistant.rewards.merkle_tree import rewards_to_merkle_tree
+from assistant.rewards.rewards_checker import diff_claim_nodes, diff_cumulative_claims
+
+badger = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+userA = "0x0000000000000000000000000000000000000001"
+userB = "0x0000000000000000000000000000000000000002"
+
+
+def tree_claim(amount):
+    return {"tokens": [badger], "cumulativeAmounts": [str(amount)]}
+
+
+def test_matching_claims_have_no_mismatches():
+    expected = {userA: {badger: 10}, userB: {badger: 20}}
+    proposed = {userA: tree_claim(10), userB: tree_claim(20)}
+    assert diff_cumulative_claims(expected, proposed) == []
+
+
+def test_changed_missing_and_extra_users_are_reported():
+    expected = {userA: {badger: 10}}
+    proposed = {userA: tree_claim(11), userB: tree_claim(20)}
+    mismatches = diff_cumulative_claims(expected, proposed)
+
+    assert [m[0] for m in mismatches] == [userA, userB]
+    assert mismatches[0][1:] == ({badger: 10}, {badger: 11})
+    assert mismatches[1][1] is None
+
+    assert diff_cumulative_claims({userB: {badger: 20}}, {}) == [
+        (userB, {badger: 20}, None)
+    ]
+
+
+def test_claims_must_carry_the_recomputed_nodes():
+    rewards = RewardsList(2, None)
+    rewards.increase_user_rewards(userA, badger, 10)
+    rewards.increase_user_rewards(userB, badger, 20)
+    (nodes, encodedNodes, entries) = rewards.to_merkle_format()
+    tree = rewards_to_merkle_tree(rewards, 0, 1, rewards)
+    assert diff_claim_nodes(entries, tree["claims"]) == []
+
+    tree["claims"][userA]["node"] = tree["claims"][userB]["node"]
+    tree["claims"][userB]["index"] = hex(5)
+    assert diff_claim_nodes(entries, tree["claims"]) == [userA, userB]
+
+    del tree["claims"][userA]
+    assert diff_claim_nodes(entries, tree["claims"]) == [userA, userB]
@@ -0,0 +1,57 @@
+import hashlib
+import json
+
+import pytest
+from assistant.rewards.rewards_file import (
+    iter_rewards_tree_chunks,
+    write_verified_rewards_tree,
+)
+from eth_utils import encode_hex
+from helpers.merkle import MerkleTree
+
+nodes = ["0x" + "01" * 100, "0x" + "02" * 100]
+merkleTree = MerkleTree(nodes)
+proofs = merkleTree.get_proofs(nodes)
+
+tree = {
+    "merkleRoot": encode_hex(merkleTree.root),
+    "cycle": 12,
+    "startBlock": "100",
+    "endBlock": "200",
+    "tokenTotals": {"0x3472A5A71965499acd81997a54BBA8D852C6E53d": 1000},
+    "claims": {
+        "0x0000000000000000000000000000000000000001": {
+            "index": "0x0",
+            "cumulativeAmounts": ["600"],
+            "proof": proofs[0],
+            "node": nodes[0],
+        },
+        "0x0000000000000000000000000000000000000002": {
+            "index": "0x1",
+            "cumulativeAmounts": ["400"],
+            "proof": proofs[1],
+            "node": nodes[1],
+        },
+    },
+    "metadata": {},
+}
+
+
+def test_streamed_output_matches_json_dump(tmp_path):
+    assert "".join(iter_rewards_tree_chunks(tree)) == json.dumps(tree)
+
+    fileName = str(tmp_path / "rewards.json")
+    contentHash = write_verified_rewards_tree(tree, fileName)
+
+    with open(fileName, "rb") as f:
+        data = f.read()
+    assert json.loads(data) == tree
+    assert contentHash == hashlib.sha256(data).hexdigest()
+
+
+def test_invalid_proofs_are_rejected(tmp_path):
+    badTree = dict(tree, merkleRoot="0x" + "ab" * 32)
+    fileName = tmp_path / "rewards.json"
+    with pytest.raises(AssertionError):
+        write_verified_rewards_tree(badTree, str(fileName))
+    assert not fileName.exists()
@@ -0,0 +1,88 @@
+import json
+import secrets
+
+from assistant.rewards.merkle_tree import verify_rewards_tree
+from assistant.rewards.rewards_layers import (
+    decode_layers_tree,
+    load_rewards_layers,
+    save_rewards_tree_layers,
+)
+from eth_utils import encode_hex
+from helpers.merkle import MerkleTree
+
+badger = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+
+
+def make_tree(numClaims):
+    users = ["0x" + secrets.token_hex(20) for i in range(numClaims)]
+    nodes = ["0x" + secrets.token_hex(200) for i in range(numClaims)]
+    tree = MerkleTree(nodes)
+    proofs = tree.get_proofs(nodes)
+    return {
+        "merkleRoot": encode_hex(tree.root),
+        "cycle": 4,
+        "startBlock": "11500000",
+        "endBlock": "11500300",
+        "tokenTotals": {badger: 10 ** 24 * numClaims},
+        "claims": {
+            user: {
+                "index": hex(i),
+                "user": user,
+                "cycle": hex(4),
+                "tokens": [badger],
+                "cumulativeAmounts": [str(10 ** 24)],
+                "proof": proofs[i],
+                "node": nodes[i],
+            }
+            for i, user in enumerate(users)
+        },
+        "metadata": {},
+    }
+
+
+def test_claims_resolve_with_derived_proofs(tmp_path):
+    tree = make_tree(1000)
+    fileName = str(tmp_path / "rewards-1-0x01.layers")
+    assert save_rewards_tree_layers(tree, fileName)
+
+    rewardsLayers = load_rewards_layers(fileName, cacheSize=16)
+    assert rewardsLayers.merkleRoot == tree["merkleRoot"]
+    for user, claim in tree["claims"].items():
+        assert rewardsLayers.get_claim(user) == claim
+    assert rewardsLayers.get_claim("0x" + "00" * 20) is None
+
+    # Proofs are stored once, not per claim
+    with open(fileName, "rb") as f:
+        data = f.read()
+    assert len(data) * 3 < len(json.dumps(tree))
+
+    # Claims can be read without the layers
+    light = decode_layers_tree(data)
+    user = next(iter(tree["claims"]))
+    assert light["merkleRoot"] == tree["merkleRoot"]
+    assert list(light["claims"].keys()) == list(tree["claims"].keys())
+    assert "proof" not in light["claims"][user]
+
+
+def test_mismatched_root_is_not_written(tmp_path):
+    tree = make_tree(10)
+    tree["merkleRoot"] = "0x" + "ab" * 32
+    fileName = str(tmp_path / "rewards-1-0x01.layers")
+    assert not save_rewards_tree_layers(tree, fileName)
+
+
+def test_sampled_proofs_are_checked(tmp_path):
+    tree = make_tree(10)
+    user = next(iter(tree["claims"]))
+    tree["claims"][user]["proof"] = tree["claims"][user]["proof"][1:]
+    fileName = str(tmp_path / "rewards-1-0x01.layers")
+    assert not save_rewards_tree_layers(tree, fileName)
+
+
+def test_rewards_tree_proofs_verify():
+    tree = make_tree(100)
+    assert verify_rewards_tree(tree) == []
+
+    user = next(iter(tree["claims"]))
+    tree["claims"][user]["proof"] = tree["claims"][user]["proof"][1:]
+    assert verify_rewards_tree(tree) == [user]
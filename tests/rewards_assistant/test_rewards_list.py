@@ -0,0 +1,72 @@
+from assistant.rewards.RewardsList import RewardsList
+
+badger = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+digg = "0x798D1bE841a82a273720CE31c822C61a67a601C3"
+
+
+def make_tree(claims):
+    return {
+        "cycle": 1,
+        "tokenTotals": {badger: 0},
+        "claims": {
+            user: {
+                "tokens": list(amounts.keys()),
+                "cumulativeAmounts": [str(a) for a in amounts.values()],
+            }
+            for user, amounts in claims.items()
+        },
+    }
+
+
+def test_merge_orders_new_users_first_and_keeps_unchanged_rows():
+    current = RewardsList.from_rewards_tree(
+        make_tree({"0x01": {badger: 10}, "0x02": {badger: 20}, "0x03": {badger: 30}})
+    )
+    new = RewardsList(2, None)
+    new.increase_user_rewards("0x04", badger, 4)
+    new.increase_user_rewards("0x02", badger, 2)
+    new.increase_user_rewards("0x02", digg, 7)
+
+    result = current.merge_cumulative(new)
+
+    assert result.users == ["0x04", "0x02", "0x01", "0x03"]
+    assert result.claims == {
+        "0x04": {badger: 4},
+        "0x02": {badger: 22, digg: 7},
+        "0x01": {badger: 10},
+        "0x03": {badger: 30},
+    }
+    assert result.totals == {badger: 66, digg: 7}
+    assert result.cycle == 2
+
+    # Unchanged users share their rows with the previous cycle, changed users do not
+    assert result.amounts[2] is current.amounts[0]
+    assert current.claims["0x02"] == {badger: 20}
+
+
+def test_updates_do_not_leak_through_shared_rows():
+    current = RewardsList.from_rewards_tree(
+        make_tree({"0x01": {badger: 10}, "0x02": {badger: 20}})
+    )
+    new = RewardsList(2, None)
+    new.increase_user_rewards("0x02", badger, 2)
+    result = current.merge_cumulative(new)
+    assert result.claims["0x01"] == {badger: 10}
+
+    result.increase_user_rewards("0x01", badger, 5)
+    assert result.claims["0x01"] == {badger: 15}
+    assert current.claims["0x01"] == {badger: 10}
+
+    other = current.merge_cumulative(new)
+    current.increase_user_rewards("0x01", digg, 1)
+    assert current.claims["0x01"] == {badger: 10, digg: 1}
+    assert other.claims["0x01"] == {badger: 10}
+
+
+def test_increase_user_rewards_clamps_negative_amounts():
+    rewards = RewardsList(1, None)
+    rewards.increase_user_rewards("0x01", badger, -5)
+    rewards.increase_user_rewards("0x01", badger, 3)
+    assert rewards.claims == {"0x01": {badger: 3}}
+    assert rewards.getTokenRewards("0x01", badger) == 3
+    assert rewards.getTokenRewards("0x02", badger) == 0
@@ -0,0 +1,107 @@
+from assistant.subgraph.client import (
+    fetch_all_geyser_events,
+    fetch_indexed_block,
+    iter_geyser_event_pages,
+    pageSize,
+)
+
+
+class FakeSubgraph:
+    """
+    Serves geyser event queries from in-memory events, applying the query filters
+    """
+
+    def __init__(self, geyserId, stakes, unstakes):
+        self.geyserId = geyserId
+        self.events = {"stakeEvents": stakes, "unstakeEvents": unstakes}
+        self.queries = 0
+
+    def __call__(self, query, variables):
+        self.queries += 1
+        if variables["geyserId"] != self.geyserId:
+            return {"data": {"geyser": None}}
+
+        field = "unstakeEvents" if "unstakeEvents(" in query else "stakeEvents"
+        matching = sorted(
+            (
+                e
+                for e in self.events[field]
+                if e["id"] > variables["cursor"]
+                and int(variables["startBlock"])
+                <= int(e["blockNumber"])
+                <= int(variables["endBlock"])
+            ),
+            key=lambda e: e["id"],
+        )
+        return {
+            "data": {
+                "geyser": {
+                    "id": self.geyserId,
+                    "totalStaked": "100",
+                    "events": matching[: variables["first"]],
+                }
+            }
+        }
+
+
+def make_events(prefix, count):
+    return [
+        {
+            "id": "{}-{:06d}".format(prefix, i),
+            "user": "0x01",
+            "amount": "1",
+            "total": "1",
+            "timestamp": str(1000 + i),
+            "blockNumber": str(count - i),
+            "data": "0x",
+        }
+        for i in range(count)
+    ]
+
+
+def test_events_are_paged_and_filtered_by_block():
+    stakes = make_events("s", pageSize * 2 + 5)
+    unstakes = make_events("u", 3)
+    subgraph = FakeSubgraph("0xgeyser", stakes, unstakes)
+
+    data = fetch_all_geyser_events("0xGeyser", 1, pageSize * 2, endpoint=subgraph)
+
+    assert len(data["stakes"]) == pageSize * 2
+    assert len(data["unstakes"]) == 3
+    assert data["totalStaked"] == "100"
+    blocks = [int(e["blockNumber"]) for e in data["stakes"]]
+    assert blocks == sorted(blocks)
+    assert subgraph.queries == 3 + 1
+
+
+def test_fetch_resumes_from_cursor():
+    stakes = make_events("s", pageSize + 10)
+    subgraph = FakeSubgraph("0xgeyser", stakes, [])
+
+    pages = iter_geyser_event_pages("0xgeyser", endpoint=subgraph)
+    kind, geyser, cursor = next(pages)
+    assert kind == "stakes" and len(geyser["events"]) == pageSize
+
+    resumed = [
+        page
+        for page in iter_geyser_event_pages(
+            "0xgeyser", cursors={"stakes": cursor}, endpoint=subgraph
+        )
+        if page[0] == "stakes"
+    ]
+    ids = [e["id"] for (kind, geyser, cursor) in resumed for e in geyser["events"]]
+    assert ids == [e["id"] for e in stakes[pageSize:]]
+
+
+def test_unknown_geyser_has_no_events():
+    subgraph = FakeSubgraph("0xgeyser", make_events("s", 3), [])
+    data = fetch_all_geyser_events("0xother", endpoint=subgraph)
+    assert data["stakes"] == [] and data["unstakes"] == []
+
+
+def test_indexed_block():
+    def subgraph(query, variables):
+        assert "_meta" in query
+        return {"data": {"_meta": {"block": {"number": 11500123}}}}
+
+    assert fetch_indexed_block(endpoint=subgraph) == 11500123